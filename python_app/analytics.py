@@ -1,15 +1,31 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import List, NamedTuple, Optional, Tuple, get_args
+
 import numpy as np
-from scipy.ndimage import convolve
-from pyproj import Transformer
 from rasterio.transform import from_bounds
 from rasterio.warp import reproject, Resampling
 
-from python_app.data_loader import common_grid,population_density_datastruct,modis_land_raster_datastruct,modis_gpp_datastruct, glw_cattle_datastruct,glw_sheep_datastruct,glw_goat_datastruct
+from python_app import grid_cache
+from python_app.convolution import convolve, convolve_many
+from python_app.derived_graph import DerivedGraph, Node
+from python_app.data_loader import common_grid, layer_registry
+from python_app.models import AnalyticsInput, AnalyticsKernel
+from python_app.warp import (WARP_PLAN_CACHE_SIZE, apply_pixel_plan, apply_plan, fill_value, lonlat_transformer,
+                             pixel_plan, warp_plan)
 
-def reproject_overlay(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_height=480):
-    src_crs = common_grid["crs"]
-    src_transform = common_grid["transform"]
-    transformer = Transformer.from_crs("EPSG:4326", src_crs, always_xy=True)
+# Bump when the formulas below change so published analytics grids are rebuilt.
+ANALYTICS_VERSION = 1
+
+@lru_cache(maxsize=WARP_PLAN_CACHE_SIZE)
+def overlay_transform(lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_height=480):
+    """
+    Affine transform of a dst_width x dst_height cutout spanning the two WGS84 corners, in the grid CRS.
+    """
+    transformer = lonlat_transformer(common_grid["crs"])
 
     # Transform to sinusoidal:
     x1, y1 = transformer.transform(lon_1, lat_1)
@@ -19,40 +35,61 @@ def reproject_overlay(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_
     max_x = max(x1, x2)
     min_y = min(y1, y2)
     max_y = max(y1, y2)
-    # Initialize an array for the destination raster
-    subset_transform = from_bounds(min_x, min_y, max_x, max_y, dst_width, dst_height)
-    dst_array = np.empty((dst_height, dst_width), dtype=src_array.dtype)
+    return from_bounds(min_x, min_y, max_x, max_y, dst_width, dst_height)
 
-    # Reproject the source array into the destination array.
-    reproject(
-        source=src_array,
-        destination=dst_array,
-        src_transform=src_transform,
-        src_crs=src_crs,
-        dst_transform=subset_transform,
-        dst_crs=src_crs,  # Change this if your destination CRS is different.
-        resampling=Resampling.nearest  # Choose an appropriate resampling method.
-    )
-
-    return dst_array, subset_transform
 
+MAX_NATIVE_SIZE = 4096
 
-def reproject_overlay_cubic(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_height=480):
-    src_crs = common_grid["crs"]
-    src_transform = common_grid["transform"]
-    transformer = Transformer.from_crs("EPSG:4326", src_crs, always_xy=True)
 
-    # Transform to sinusoidal:
+def overlay_native_size(lon_1, lat_1, lon_2, lat_2, width=None, height=None):
+    """
+    (width, height) of a cutout of the two WGS84 corners at the grid's own resolution.
+    Given only one of width and height, the other follows the aspect ratio of the area on the grid.
+    """
+    transformer = lonlat_transformer(common_grid["crs"])
     x1, y1 = transformer.transform(lon_1, lat_1)
     x2, y2 = transformer.transform(lon_2, lat_2)
+    grid_transform = common_grid["transform"]
+    # Extent in grid pixels, at least one pixel along each axis.
+    span_x = max(1.0, abs(x2 - x1) / abs(grid_transform.a))
+    span_y = max(1.0, abs(y2 - y1) / abs(grid_transform.e))
+    if width is None and height is None:
+        width, height = round(span_x), round(span_y)
+    elif width is None:
+        width = max(1, round(height * span_x / span_y))
+    elif height is None:
+        height = max(1, round(width * span_y / span_x))
+    if width > MAX_NATIVE_SIZE or height > MAX_NATIVE_SIZE:
+        raise ValueError(f"Area spans {width}x{height} grid pixels; pass an explicit width and height")
+    return width, height
+
+
+def warp_overlay(src_array, subset_transform, dst_width=854, dst_height=480, resampling=Resampling.nearest,
+                 src_transform=None, dst_crs=None):
+    """
+    Warp a grid (or a [band, rows, columns] stack of grids) into the cutout described by subset_transform.
+    src_transform defaults to the common grid; pass an Overview's transform to warp one of its levels.
+    subset_transform is in the grid CRS unless dst_crs (e.g. "EPSG:3857" for map tiles) is given.
+    Pixels outside the grid get warp.fill_value (NaN, or 255 for land cover).
+    """
+    src_transform = common_grid["transform"] if src_transform is None else src_transform
+    src_crs = common_grid["crs"]
+    src_height, src_width = src_array.shape[-2:]
+    if dst_crs is None:
+        plan = warp_plan(src_transform, src_height, src_width, subset_transform, dst_width, dst_height, resampling)
+        if plan is not None and (plan.row_weights is None or src_array.dtype.kind == 'f'):
+            return apply_plan(plan, src_array)
+    else:
+        plan = pixel_plan(src_transform, src_height, src_width, src_crs, dst_crs, subset_transform,
+                          dst_width, dst_height, resampling)
+        if plan is not None and (plan.row_weights is None or src_array.dtype.kind == 'f'):
+            return apply_pixel_plan(plan, src_array)
 
-    min_x = min(x1, x2)
-    max_x = max(x1, x2)
-    min_y = min(y1, y2)
-    max_y = max(y1, y2)
     # Initialize an array for the destination raster
-    subset_transform = from_bounds(min_x, min_y, max_x, max_y, dst_width, dst_height)
-    dst_array = np.empty((dst_height, dst_width), dtype=src_array.dtype)
+    # GDAL needs the whole source in memory (a windowed stack is read here).
+    src_array = np.asarray(src_array)
+    fill = fill_value(src_array.dtype)
+    dst_array = np.full(src_array.shape[:-2] + (dst_height, dst_width), fill, dtype=src_array.dtype)
 
     # Reproject the source array into the destination array.
     reproject(
@@ -61,10 +98,22 @@ def reproject_overlay_cubic(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854
         src_transform=src_transform,
         src_crs=src_crs,
         dst_transform=subset_transform,
-        dst_crs=src_crs,  # Change this if your destination CRS is different.
-        resampling=Resampling.cubic  # Choose an appropriate resampling method.
+        dst_crs=src_crs if dst_crs is None else dst_crs,
+        dst_nodata=fill,
+        resampling=resampling
     )
+    return dst_array
+
 
+def reproject_overlay(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_height=480):
+    subset_transform = overlay_transform(lon_1, lat_1, lon_2, lat_2, dst_width, dst_height)
+    dst_array = warp_overlay(src_array, subset_transform, dst_width, dst_height, Resampling.nearest)
+    return dst_array, subset_transform
+
+
+def reproject_overlay_cubic(src_array, lon_1, lat_1, lon_2, lat_2, dst_width=854, dst_height=480):
+    subset_transform = overlay_transform(lon_1, lat_1, lon_2, lat_2, dst_width, dst_height)
+    dst_array = warp_overlay(src_array, subset_transform, dst_width, dst_height, Resampling.cubic)
     return dst_array, subset_transform
 
 
@@ -99,16 +148,12 @@ expanded_kernel = np.kron(np.ones((6, 6)), wide_kernel)
 
 
 
-change_vegetation = convolve(map_land(modis_land_raster_datastruct.array[-1]), normalized_kernel, mode='constant', cval=0) - convolve(map_land(modis_land_raster_datastruct.array[1]), normalized_kernel, mode='constant', cval=0)
-change_vegetation[(change_vegetation >= -0.2) & (change_vegetation <= 0.2)] = np.nan
 
-def analyze_correlation(past_1, future_1, past_2, future_2):
+def analyze_correlation(past_1, future_1, past_2, future_2, kernel_1=expanded_kernel):
 
-    # Apply convolution
-    past_1_conv = convolve(past_1, expanded_kernel, mode='constant', cval=0)
-    future_1_conv = convolve(future_1, expanded_kernel, mode='constant', cval=0)
-    past_2_conv = convolve(past_2, normalized_kernel, mode='constant', cval=0)
-    future_2_conv = convolve(future_2, normalized_kernel, mode='constant', cval=0)
+    # Apply convolution (both years of a layer in one batched call)
+    past_1_conv, future_1_conv = convolve_many([past_1, future_1], kernel_1)
+    past_2_conv, future_2_conv = convolve_many([past_2, future_2], normalized_kernel)
 
     # Calculate relative changes, normalized by maximum absolute difference
     change1 = (future_1_conv - past_1_conv)
@@ -123,23 +168,267 @@ def analyze_correlation(past_1, future_1, past_2, future_2):
     anti_correlation = relative_change_1 * relative_change_2
     return anti_correlation
 
-start= 0
-end=10
-
-maped_pop_1 = map_pop(population_density_datastruct.array[start])
-maped_pop_2 = map_pop(population_density_datastruct.array[end])
-maped_gpp_1 = map_pop(modis_gpp_datastruct.array[start])
-maped_gpp_2 = map_pop(modis_gpp_datastruct.array[end])
-maped_land_1 =map_land(modis_land_raster_datastruct.array[start])
-maped_land_2 =map_land(modis_land_raster_datastruct.array[end])
-maped_animals_1 = map_pop(glw_sheep_datastruct.array[start] + glw_goat_datastruct.array[start] + glw_cattle_datastruct.array[start])
-maped_animals_2 = map_pop(glw_sheep_datastruct.array[end] + glw_goat_datastruct.array[end] + glw_cattle_datastruct.array[end])
-
-animals_desertification = analyze_correlation(maped_land_1,maped_land_2,maped_animals_1,maped_animals_2)
-animals_desertification[ (animals_desertification <= 0.01)] = np.nan
-
-animal_gpp = analyze_correlation(maped_gpp_1,maped_gpp_2,maped_animals_1,maped_animals_2)
-animal_gpp[ (animal_gpp >= -0.01)] = np.nan
-
-
-print('analytics data calculated')
\ No newline at end of file
+def maped_animals(year):
+    sheep, goat, cattle = (np.asarray(layer_registry.datastruct(name).array[year])
+                           for name in ("glw_sheep", "glw_goat", "glw_cattle"))
+    return map_pop(sheep + goat + cattle)
+
+
+def _mapped_input(dataset, mapping):
+    return lambda year: mapping(np.asarray(layer_registry.datastruct(dataset).array[year]))
+
+
+LIVESTOCK = ("glw_sheep", "glw_goat", "glw_cattle")
+
+# Inputs the analytics engine can compare: name -> (datasets read, year index -> mapped 2D grid).
+ANALYTICS_INPUTS = {
+    "land": (("modis_land",), _mapped_input("modis_land", map_land)),
+    "gpp": (("modis_gpp",), _mapped_input("modis_gpp", map_pop)),
+    "livestock": (LIVESTOCK, maped_animals),
+    "population": (("population_density",), _mapped_input("population_density", map_pop)),
+    "precipitation": (("climate_precipitation",), _mapped_input("climate_precipitation", map_pop)),
+}
+KERNELS = {"normalized": normalized_kernel, "wide": expanded_kernel}
+assert set(ANALYTICS_INPUTS) == set(get_args(AnalyticsInput)), "ANALYTICS_INPUTS and models.AnalyticsInput are out of sync"
+assert set(KERNELS) == set(get_args(AnalyticsKernel)), "KERNELS and models.AnalyticsKernel are out of sync"
+ANALYSIS_KINDS = ("change", "correlation")
+ANALYSIS_MASKS = ("above", "below", "outside")
+# Parametric analyses kept in memory; least recently used ones are dropped beyond this.
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 32))
+N_YEARS = 14
+
+
+@dataclass(frozen=True)
+class Analysis:
+    """
+    One analytics grid, fully described by its parameters.
+
+    - kind: "change" is the smoothed change of layer_a from year_from to year_to; "correlation" is the
+      product of the changes of layer_a and layer_b, each normalised by its largest absolute change
+      (positive where both move the same way).
+    - layer_a / layer_b: ANALYTICS_INPUTS names; layer_b is only used by correlations.
+    - year_from / year_to: year indices, 0 = 2010.
+    - kernel: KERNELS entry smoothing layer_a; layer_b is always smoothed with the normalized kernel.
+    - mask / threshold: keep only values above or below threshold, or outside [-threshold, threshold];
+      everything else becomes NaN. No mask keeps every value.
+    """
+    kind: str
+    layer_a: str
+    layer_b: Optional[str] = None
+    year_from: int = 0
+    year_to: int = 10
+    kernel: str = "normalized"
+    mask: Optional[str] = None
+    threshold: float = 0.0
+
+    def validate(self) -> "Analysis":
+        if self.kind not in ANALYSIS_KINDS:
+            raise ValueError(f"Unknown analysis: {self.kind}")
+        for layer in (self.layer_a, self.layer_b) if self.kind == "correlation" else (self.layer_a,):
+            if layer not in ANALYTICS_INPUTS:
+                raise ValueError(f"Unknown analytics input: {layer}")
+        if self.kernel not in KERNELS:
+            raise ValueError(f"Unknown kernel: {self.kernel}")
+        if self.mask is not None and self.mask not in ANALYSIS_MASKS:
+            raise ValueError(f"Unknown mask: {self.mask}")
+        for year in (self.year_from, self.year_to):
+            if not 0 <= year < N_YEARS:
+                raise ValueError(f"Year {2010 + year} is outside 2010-{2009 + N_YEARS}")
+        if self.year_from == self.year_to:
+            raise ValueError("year_from and year_to must differ")
+        return self
+
+    def datasets(self) -> Tuple[str, ...]:
+        layers = (self.layer_a, self.layer_b) if self.kind == "correlation" else (self.layer_a,)
+        return tuple(dict.fromkeys(dataset for layer in layers for dataset in ANALYTICS_INPUTS[layer][0]))
+
+
+def analysis_node(analysis: Analysis) -> Node:
+    """
+    The dependency graph of an analysis (see python_app.derived_graph):
+    input(layer, year) -> smooth(kernel) -> change -> [normalise -> product] -> mask.
+    """
+    def change(layer, kernel):
+        return Node("change", (), tuple(Node("smooth", (kernel,), (Node("input", (layer, year)),))
+                                        for year in (analysis.year_from, analysis.year_to)))
+
+    if analysis.kind == "change":
+        grid = change(analysis.layer_a, analysis.kernel)
+    else:
+        # layer_b is always smoothed with the normalized kernel, as in analyze_correlation.
+        grid = Node("product", (), (Node("normalise", (), (change(analysis.layer_a, analysis.kernel),)),
+                                    Node("normalise", (), (change(analysis.layer_b, "normalized"),))))
+    if analysis.mask is None:
+        return grid
+    return Node("mask", (analysis.mask, analysis.threshold), (grid,))
+
+
+def _normalise(change):
+    # Relative change, normalized by the maximum absolute difference (as in analyze_correlation).
+    return np.clip(change / np.nanmax(np.abs(change)), -1, 1)
+
+
+def _mask(params, grid):
+    mask, threshold = params
+    grid = grid.copy()
+    if mask == "above":
+        grid[grid <= threshold] = np.nan
+    elif mask == "below":
+        grid[grid >= threshold] = np.nan
+    elif mask == "outside":
+        grid[(grid >= -threshold) & (grid <= threshold)] = np.nan
+    return grid
+
+
+@lru_cache(maxsize=256)
+def _year_content_hash(dataset: str, dataset_key: str, year: int) -> str:
+    # dataset_key (which follows the source files) only decides when the year has to be hashed again.
+    array = np.ascontiguousarray(layer_registry.datastruct(dataset).array[year])
+    return hashlib.blake2b(array.data, digest_size=20).hexdigest()
+
+
+def _input_fingerprint(node: Node) -> str:
+    layer, year = node.params
+    datasets = ANALYTICS_INPUTS[layer][0]
+    return grid_cache.cache_key(ANALYTICS_VERSION, "input", layer, year,
+                                *[_year_content_hash(d, layer_registry.key(d), year) for d in datasets])
+
+
+derived_graph = DerivedGraph(
+    ops={
+        "input": lambda params: ANALYTICS_INPUTS[params[0]][1](params[1]),
+        "smooth": lambda params, grid: convolve(grid, KERNELS[params[0]]),
+        "change": lambda params, past, future: future - past,
+        "normalise": lambda params, change: _normalise(change),
+        "product": lambda params, a, b: a * b,
+        "mask": _mask,
+    },
+    leaf_fingerprint=_input_fingerprint,
+    # Convolutions are the only costly step; everything else is elementwise.
+    persisted=("smooth",),
+)
+
+
+def compute_analysis(analysis: Analysis) -> np.ndarray:
+    return derived_graph.evaluate(analysis_node(analysis))
+
+
+# The published analytics grids: name -> the analysis it is.
+DERIVED_ANALYSES = {
+    "change_vegetation": Analysis("change", "land", year_from=1, year_to=N_YEARS - 1,
+                                  mask="outside", threshold=0.2),
+    "animals_desertification": Analysis("correlation", "land", "livestock", 0, 10, kernel="wide",
+                                        mask="above", threshold=0.01),
+    "animal_gpp": Analysis("correlation", "gpp", "livestock", 0, 10, kernel="wide",
+                           mask="below", threshold=-0.01),
+}
+
+# name -> (builder, datasets it is derived from)
+DERIVED_LAYERS = {
+    name: (partial(compute_analysis, analysis), analysis.datasets())
+    for name, analysis in DERIVED_ANALYSES.items()
+}
+
+
+class DerivedGrid(NamedTuple):
+    key: str
+    array: np.ndarray
+
+
+_build_lock = threading.Lock()
+
+
+def _derived_grid(name, previous: Optional[DerivedGrid] = None) -> DerivedGrid:
+    """
+    The grid of a derived layer for the datasets in use: previous if its fingerprint still matches,
+    attached from the grid cache if known, otherwise evaluated, reusing every persisted graph node
+    whose inputs did not change.
+    """
+    node = analysis_node(DERIVED_ANALYSES[name])
+    fingerprints = derived_graph.fingerprints(node)
+    key = grid_cache.cache_key(ANALYTICS_VERSION, name, fingerprints[node])
+    if previous is not None and previous.key == key:
+        return previous
+    return DerivedGrid(key, grid_cache.shared_array(
+        name, key, lambda: derived_graph.evaluate(node, fingerprints, persist=True)))
+
+
+def derived_grid(name) -> DerivedGrid:
+    """
+    The grid of a derived layer with its key, as published with the registry state in use (so it
+    always matches the datasets a request reads), computing it on first use.
+
+    The grids are published through the grid cache, so every worker maps the same read-only copy
+    and the float intermediates (map_land/map_pop) only exist in the building process.
+    """
+    published = layer_registry.state().derived.get(name)
+    if published is None:
+        with _build_lock:
+            published = layer_registry.state().derived.get(name)
+            if published is None:
+                published = layer_registry.publish_derived(name, _derived_grid(name))
+    return published
+
+
+def get_derived(name):
+    return derived_grid(name).array
+
+
+def derived_key(name):
+    """
+    Cache key of the published grid of a derived layer: changes exactly when the grid does.
+    """
+    return derived_grid(name).key
+
+
+def refresh_derived(previous) -> List[str]:
+    """
+    Reload hook: bring the derived grids that were in use in the previous registry state up to date with
+    the state being published. Only grids whose input content changed are recomputed (and within them
+    only the invalidated graph nodes). Returns the names of the grids that changed.
+    """
+    changed = []
+    for name, grid in previous.derived.items():
+        fresh = layer_registry.publish_derived(name, _derived_grid(name, grid))
+        if fresh.key != grid.key:
+            changed.append(name)
+    return changed
+
+
+layer_registry.add_reload_hook(refresh_derived)
+
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def _cached_analysis(analysis: Analysis, fingerprint: str) -> np.ndarray:
+    # fingerprint (the content hash of the analysis graph) only makes the memo follow data changes.
+    grid = compute_analysis(analysis)
+    grid.flags.writeable = False
+    return grid
+
+
+def get_analysis(analysis: Analysis) -> np.ndarray:
+    """
+    The read-only grid of any analysis: the published grid if it is one of DERIVED_ANALYSES,
+    otherwise computed on demand and kept in a bounded LRU memo.
+    """
+    analysis.validate()
+    for name, derived in DERIVED_ANALYSES.items():
+        if derived == analysis:
+            return get_derived(name)
+    node = analysis_node(analysis)
+    return _cached_analysis(analysis, derived_graph.fingerprints(node)[node])
+
+
+def analysis_cache_stats() -> dict:
+    info = _cached_analysis.cache_info()
+    return {"entries": info.currsize, "max_entries": info.maxsize, "hits": info.hits, "misses": info.misses,
+            "graph_nodes": derived_graph.stats()}
+
+
+def warm_up():
+    """
+    Load every dataset and derived grid now instead of on the first request.
+    """
+    layer_registry.warm_up()
+    for name in DERIVED_LAYERS:
+        get_derived(name)
@@ -0,0 +1,55 @@
+"""
+Compare the float32 stacks of each dataset (DataStruct plus masked copy) with their compact encoding:
+bytes held, decoding error, and the cost of reading one tile-sized window.
+
+Run from the repository root:
+    python -m python_app.benchmarks.compact_benchmark
+"""
+import time
+
+import numpy as np
+
+from python_app.compact import CompactStack, encode
+from python_app.data_loader import layer_registry
+
+ROUNDS = 200
+WINDOW = (5, slice(300, 556), slice(200, 456))
+
+
+def milliseconds_per_call(fn, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e3
+
+
+def main():
+    for name in layer_registry.names():
+        spec = layer_registry.spec(name)
+        datastruct = layer_registry.datastruct(name)
+        data = np.asarray(datastruct.array)
+        special = data == datastruct.nodata if spec.nodata_rule is None else spec.nodata_rule(data, datastruct.nodata)
+        encoding = encode(data, special)
+
+        raw = CompactStack(encoding, masked=False)
+        assert np.array_equal(np.asarray(raw)[special], data[special]), name
+        error = float(np.max(np.abs(np.asarray(raw)[~special].astype(np.float64) - data[~special])))
+        assert error <= encoding.max_error, name
+
+        held = data.nbytes
+        reference, view = data, raw
+        if spec.nodata_rule is not None:
+            reference = np.asarray(layer_registry.masked(name).array)
+            view = CompactStack(encoding, masked=True)
+            assert np.array_equal(np.isnan(np.asarray(view)), np.isnan(reference)), name
+            held += reference.nbytes
+
+        before = milliseconds_per_call(lambda: np.array(reference[WINDOW]))
+        after = milliseconds_per_call(lambda: view[WINDOW])
+        print(f"{name:22s} {encoding.codes.dtype}  {held / 1e6:5.1f} MB -> {encoding.codes.nbytes / 1e6:5.1f} MB "
+              f"({held / encoding.codes.nbytes:3.1f}x)  max error {error:.3g} (bound {encoding.max_error:.3g})  "
+              f"256x256 window: {before:.3f} ms float32, {after:.3f} ms decoded")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare scipy.ndimage.convolve, as analyze_correlation used to call it, with the strategies of
+python_app.convolution on the analytics inputs.
+
+Run from the repository root:
+    python -m python_app.benchmarks.convolution_benchmark
+"""
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from python_app.analytics import ANALYTICS_INPUTS, KERNELS
+from python_app.convolution import choose_strategy, convolve, convolve_many
+
+ROUNDS = 5
+YEARS = (0, 10)
+
+
+def milliseconds_per_call(fn, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e3
+
+
+def reference(array, kernel):
+    return ndimage.convolve(array, kernel, mode='constant', cval=0)
+
+
+def main():
+    for kernel_name, kernel in KERNELS.items():
+        for input_name, (_, mapped) in ANALYTICS_INPUTS.items():
+            grids = [mapped(year) for year in YEARS]
+            expected = [reference(grid, kernel) for grid in grids]
+            chosen = choose_strategy(kernel, grids[0].shape)
+            for strategy in ("separable", "fft"):
+                if strategy == "separable" and chosen == "direct":
+                    continue
+                actual = convolve(np.stack(grids), kernel, strategy)
+                for got, want in zip(actual, expected):
+                    if strategy == "separable":
+                        assert np.array_equal(got, want, equal_nan=True), (kernel_name, input_name, strategy)
+                    else:
+                        np.testing.assert_allclose(got, want, rtol=1e-6, atol=0)
+
+            before = milliseconds_per_call(lambda: [reference(grid, kernel) for grid in grids])
+            after = milliseconds_per_call(lambda: convolve_many(grids, kernel))
+            print(f"{kernel_name:10s} {input_name:13s} {chosen:9s}  ndimage: {before:7.1f} ms   "
+                  f"chosen: {after:7.1f} ms   speedup: {before / after:5.1f}x")
+    print("parity with ndimage.convolve: ok (separable identical, fft to float32 rounding)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare the old matplotlib-figure rendering path with the lookup-table renderer.
+
+Run from the repository root:
+    python -m python_app.benchmarks.render_benchmark
+"""
+import io
+import time
+
+import numpy as np
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+
+from python_app.data_loader import layer_registry
+from python_app.analytics import reproject_overlay
+from python_app.renderer import LAND_COVER_CLASSES, colorize_continuous, colorize_land_cover, \
+    render_continuous, render_land_cover
+
+BBOX = (-12.3143, 16.9779, -11.2843, 16.4229)
+ROUNDS = 20
+
+
+def legacy_render(array, **imshow_kwargs):
+    fig, ax = plt.subplots(figsize=(16, 9))
+    ax.imshow(array, **imshow_kwargs)
+    ax.set_axis_off()
+    png_bytes = io.BytesIO()
+    fig.patch.set_alpha(0)
+    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
+    plt.close(fig)
+    png_bytes.seek(0)
+    return png_bytes
+
+
+def legacy_land_norm():
+    sorted_keys = sorted(LAND_COVER_CLASSES.keys())
+    cmap = mcolors.ListedColormap([LAND_COVER_CLASSES[k][1] for k in sorted_keys], name='LandCoverMap')
+    norm = mcolors.BoundaryNorm(sorted_keys + [max(sorted_keys) + 1], cmap.N)
+    return cmap, norm
+
+
+def tiles_per_second(render, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    return rounds / (time.perf_counter() - start)
+
+
+def main():
+    gpp = layer_registry.masked("modis_gpp")
+    gpp_max = gpp.stats.global_max
+    gpp_cutout, _ = reproject_overlay(gpp.array[5], *BBOX)
+    land_cutout, _ = reproject_overlay(layer_registry.datastruct("modis_land").array[5], *BBOX)
+    land_nan = np.where(land_cutout == 255, np.nan, land_cutout)
+    cmap, norm = legacy_land_norm()
+
+    # Colour parity against matplotlib's own colormap/normalisation.
+    expected = matplotlib.colormaps['BuGn'](
+        mcolors.Normalize(vmax=gpp_max)(np.ma.masked_invalid(gpp_cutout)), bytes=True)
+    assert np.array_equal(colorize_continuous(gpp_cutout, 'BuGn', vmax=gpp_max), expected)
+    expected = cmap(norm(np.ma.masked_invalid(land_nan)), bytes=True)
+    assert np.array_equal(colorize_land_cover(land_cutout), expected)
+    print("colour parity with matplotlib: ok")
+
+    cases = {
+        "gpp": (lambda: legacy_render(gpp_cutout, cmap='BuGn', vmax=gpp_max),
+                lambda: render_continuous(gpp_cutout, 'BuGn', vmax=gpp_max)),
+        "land": (lambda: legacy_render(land_nan, cmap=cmap, norm=norm),
+                 lambda: render_land_cover(land_cutout)),
+    }
+    for name, (before, after) in cases.items():
+        before_rate = tiles_per_second(before)
+        after_rate = tiles_per_second(after)
+        print(f"{name:5s} matplotlib: {before_rate:8.1f} tiles/s   lut: {after_rate:8.1f} tiles/s   "
+              f"speedup: {after_rate / before_rate:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Check that neighbouring XYZ tiles are seamless and time the tile renderer.
+
+Two vertically adjacent tiles of every layer, decoded from the PNGs /tiles serves, must equal the two
+halves of one render spanning both: same samples and same colour range.
+
+Run from the repository root:
+    python -m python_app.benchmarks.tile_benchmark
+"""
+import time
+
+import numpy as np
+from PIL import Image
+
+from python_app.tiles import TILE_SIZE, tile_ground_pixel, tile_transform
+from python_app.visualizer import LAYERS, mercator_rgba, render_tile
+
+# Upper tile of each adjacent pair, over the Senegal river valley.
+TILES = ((9, 239, 231), (10, 478, 463))
+YEAR = 5
+ROUNDS = 20
+
+
+def tile_rgba(layer, z, x, y):
+    return np.asarray(Image.open(render_tile(layer, z, x, y, year=YEAR)).convert("RGBA"))
+
+
+def main():
+    for layer in LAYERS:
+        for z, x, y in TILES:
+            tiles = np.concatenate([tile_rgba(layer, z, x, y), tile_rgba(layer, z, x, y + 1)])
+            spanning = mercator_rgba(layer, tile_transform(z, x, y), TILE_SIZE, 2 * TILE_SIZE,
+                                     tile_ground_pixel(z, y), year=YEAR)
+            assert np.array_equal(tiles, spanning), (layer, z, x, y)
+
+        z, x, y = TILES[-1]
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            render_tile(layer, z, x, y, year=YEAR)
+        print(f"{layer:22s} seamless at z{TILES[0][0]}-z{TILES[-1][0]}, "
+              f"{(time.perf_counter() - start) / ROUNDS * 1e3:.1f} ms per tile")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compare the GDAL reproject previously run for every cutout with the cached warp plans.
+
+Run from the repository root:
+    python -m python_app.benchmarks.warp_benchmark
+"""
+import time
+
+import numpy as np
+from pyproj import Transformer
+from rasterio.transform import from_bounds
+from rasterio.warp import Resampling, reproject
+
+from python_app.data_loader import common_grid, layer_registry
+from python_app.analytics import reproject_overlay, reproject_overlay_cubic
+from python_app.warp import fill_value
+
+BBOX = (-12.3143, 16.9779, -11.2843, 16.4229)
+SIZES = ((854, 480), (256, 256))
+ROUNDS = 50
+
+
+def legacy_reproject(src_array, lon_1, lat_1, lon_2, lat_2, dst_width, dst_height, resampling):
+    # The former reproject_overlay: a new Transformer and a full GDAL warp on every call.
+    src_crs = common_grid["crs"]
+    transformer = Transformer.from_crs("EPSG:4326", src_crs, always_xy=True)
+    x1, y1 = transformer.transform(lon_1, lat_1)
+    x2, y2 = transformer.transform(lon_2, lat_2)
+    subset_transform = from_bounds(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), dst_width, dst_height)
+    fill = fill_value(src_array.dtype)
+    dst_array = np.full((dst_height, dst_width), fill, dtype=src_array.dtype)
+    reproject(source=src_array, destination=dst_array, src_transform=common_grid["transform"], src_crs=src_crs,
+              dst_transform=subset_transform, dst_crs=src_crs, dst_nodata=fill, resampling=resampling)
+    return dst_array, subset_transform
+
+
+def microseconds_per_call(fn, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    land = np.ascontiguousarray(layer_registry.datastruct("modis_land").array[5])
+    population = np.ascontiguousarray(layer_registry.masked("population_density").array[5])
+    cases = {
+        "nearest": (land, reproject_overlay, Resampling.nearest),
+        "cubic": (population, reproject_overlay_cubic, Resampling.cubic),
+    }
+
+    for dst_width, dst_height in SIZES:
+        for name, (array, fast, resampling) in cases.items():
+            expected, _ = legacy_reproject(array, *BBOX, dst_width, dst_height, resampling)
+            actual, _ = fast(array, *BBOX, dst_width=dst_width, dst_height=dst_height)
+            if resampling == Resampling.nearest:
+                assert np.array_equal(actual, expected)
+            else:
+                np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-3)
+
+            before = microseconds_per_call(
+                lambda: legacy_reproject(array, *BBOX, dst_width, dst_height, resampling))
+            after = microseconds_per_call(
+                lambda: fast(array, *BBOX, dst_width=dst_width, dst_height=dst_height))
+            print(f"{name:7s} {dst_width}x{dst_height}  gdal: {before:8.0f} us   plan: {after:8.0f} us   "
+                  f"speedup: {before / after:5.1f}x")
+    print("parity with GDAL: ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Compact storage of [year, rows, columns] stacks as small unsigned integer codes.
+
+encode() picks the smallest representation that holds a stack:
+- uint8 or uint16 codes with a per-year offset when every value is a whole number and each year's
+  range fits: lossless (land cover classes, MODIS GPP);
+- otherwise uint16 codes spread over each year's value range: every value is off by at most half
+  a step, (max - min) / 65534 / 2 (about 0.004 for the livestock densities), plus float32 rounding.
+Special values (nodata and fill codes, selected by a mask) take the top codes, one each, so they
+decode exactly.
+
+A CompactStack decodes the codes lazily, window by window, either to the raw values (specials
+restored) or to the masked float32 view (specials NaN). Both views share one code array: a
+quarter of a float32 stack plus its masked copy.
+"""
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from python_app.lazy_stack import LazyStack
+
+# Distinct special values an encoding can restore exactly (MODIS GPP has 7 fill codes).
+MAX_SPECIALS = 16
+
+
+class Encoding(NamedTuple):
+    codes: np.ndarray            # [year, rows, columns] uint8 or uint16
+    scale: np.ndarray            # [year] value step between two codes
+    offset: np.ndarray           # [year] value of code 0
+    specials: Tuple[float, ...]  # code (max - i) decodes to specials[i]
+    dtype: np.dtype              # dtype of the raw values
+    max_error: float             # largest absolute decoding error of a valid value
+
+    @property
+    def first_special(self) -> int:
+        return np.iinfo(self.codes.dtype).max + 1 - len(self.specials)
+
+
+def _matches(values: np.ndarray, special: float) -> np.ndarray:
+    return np.isnan(values) if np.isnan(special) else values == special
+
+
+def encode(array: np.ndarray, special: np.ndarray) -> Encoding:
+    """
+    Encode a [year, rows, columns] stack; special marks the pixels whose values must decode exactly.
+    """
+    if array.dtype.kind == 'f':
+        special = special | np.isnan(array)
+    specials = tuple(float(v) for v in np.unique(array[special]))
+    if len(specials) > MAX_SPECIALS:
+        raise ValueError(f"{len(specials)} distinct special values, at most {MAX_SPECIALS} can be encoded")
+
+    n_years = len(array)
+    low, high = np.zeros(n_years), np.zeros(n_years)
+    whole = True
+    for year in range(n_years):
+        values = array[year][~special[year]]
+        if values.size:
+            low[year], high[year] = values.min(), values.max()
+            whole = whole and (array.dtype.kind in 'iu' or bool(np.all(values == np.floor(values))))
+
+    for dtype in (np.uint8, np.uint16):
+        steps = np.iinfo(dtype).max + 1 - len(specials)
+        if whole and np.all(high - low <= steps - 1):
+            scale, max_error = np.ones(n_years), 0.0
+            break
+    else:
+        steps = np.iinfo(dtype).max + 1 - len(specials)
+        scale = np.where(high > low, (high - low) / (steps - 1), 1.0)
+        # Half a step, plus the rounding of the float32 decoding arithmetic.
+        max_error = float(np.max(scale / 2 + np.finfo(np.float32).eps * np.maximum(np.abs(low), np.abs(high))))
+
+    top = np.iinfo(dtype).max
+    codes = np.empty(array.shape, dtype=dtype)
+    for year in range(n_years):
+        scaled = (array[year].astype(np.float64) - low[year]) / scale[year]
+        scaled[special[year]] = 0
+        codes[year] = np.clip(np.rint(scaled), 0, steps - 1)
+        for i, value in enumerate(specials):
+            codes[year][special[year] & _matches(array[year], value)] = top - i
+    return Encoding(codes=codes, scale=scale, offset=low, specials=specials, dtype=array.dtype, max_error=max_error)
+
+
+def decode(encoding: Encoding, years: List[int], row_start: int, row_stop: int, col_start: int, col_stop: int,
+           masked: bool) -> np.ndarray:
+    """
+    The [year, rows, columns] window of some years, as raw values or as the masked float32 view.
+    """
+    codes = encoding.codes[years, row_start:row_stop, col_start:col_stop]
+    values = codes.astype(np.float32)
+    values *= encoding.scale[years].astype(np.float32)[:, None, None]
+    values += encoding.offset[years].astype(np.float32)[:, None, None]
+    if masked:
+        values[codes >= encoding.first_special] = np.nan
+        return values
+    top = np.iinfo(codes.dtype).max
+    for i, value in enumerate(encoding.specials):
+        values[codes == top - i] = value
+    return values.astype(encoding.dtype, copy=False)
+
+
+class CompactStack(LazyStack):
+    """
+    Lazy [year, rows, columns] view of an Encoding: raw values, or float32 with NaN for the specials
+    when masked is set.
+    """
+
+    def __init__(self, encoding: Encoding, masked: bool, years: Optional[Sequence[int]] = None,
+                 squeeze: bool = False):
+        super().__init__(range(len(encoding.codes)) if years is None else years, encoding.codes.shape[1:],
+                         np.float32 if masked else encoding.dtype, squeeze)
+        self.encoding = encoding
+        self.masked = masked
+
+    def _read(self, years: List[int], row_start, row_stop, col_start, col_stop) -> np.ndarray:
+        return decode(self.encoding, years, row_start, row_stop, col_start, col_stop, self.masked)
+
+    def _subset(self, years: List[int], squeeze: bool) -> "CompactStack":
+        return CompactStack(self.encoding, self.masked, years, squeeze)
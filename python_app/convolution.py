@@ -0,0 +1,188 @@
+"""
+Zero-padded 2D convolution that picks the cheapest strategy for its kernel.
+
+Every strategy reproduces scipy.ndimage.convolve(array, kernel, mode='constant', cval=0): the same
+alignment (even-sized kernels included), sums in float64 rounded once to the array's dtype, and
+NaN spreading to every pixel whose footprint of nonzero weights touches one.
+
+- direct: ndimage.convolve itself, for small kernels such as the 3x3 normalized kernel.
+- separable: the kernel is split into rank-one terms with an SVD, after taking out its most common
+  value as a constant term. The tiled 18x18 expanded_kernel (2 everywhere, 3 on every third pixel)
+  becomes a box, summed as differences of cumulative sums, plus one sparse term for ndimage.convolve1d.
+- fft: scipy.signal.fftconvolve, for large kernels that do not split into a few terms.
+
+Arrays may carry leading axes (e.g. years); all of them are convolved in one call. Only float arrays
+take the fast paths; other dtypes keep ndimage's integer semantics through the direct strategy.
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import ndimage, signal
+
+# Largest number of rank-one terms a kernel may split into before separable stops paying off.
+MAX_SEPARABLE_RANK = 3
+# Rough multiply-adds per pixel of one FFT convolution (forward + inverse transforms of the padded grid).
+FFT_COST_PER_LOG2 = 6
+
+Terms = Tuple[Tuple[np.ndarray, np.ndarray], ...]
+
+
+def _kernel_key(kernel: np.ndarray) -> tuple:
+    kernel = np.asarray(kernel, dtype=np.float64)
+    return kernel.shape, kernel.tobytes()
+
+
+def _svd_terms(kernel: np.ndarray) -> Optional[list]:
+    u, s, vt = np.linalg.svd(kernel)
+    rank = int(np.sum(s > s[0] * 1e-12)) if s[0] > 0 else 0
+    if rank > MAX_SEPARABLE_RANK:
+        return None
+    return [(u[:, i] * s[i], vt[i]) for i in range(rank)]
+
+
+@lru_cache(maxsize=64)
+def _separable_terms(key: tuple) -> Optional[Terms]:
+    """
+    (column factor, row factor) pairs whose outer products sum to the kernel, or None.
+
+    Two splits are tried: a plain SVD, and the kernel's most common value as a constant term plus an
+    SVD of the rest (a tiled kernel like expanded_kernel is then a box plus one sparse term).
+    The cheaper valid one wins.
+    """
+    shape, data = key
+    kernel = np.frombuffer(data, dtype=np.float64).reshape(shape)
+    candidates = [_svd_terms(kernel)]
+    values, counts = np.unique(kernel, return_counts=True)
+    offset = values[np.argmax(counts)]
+    if offset != 0:
+        rest = _svd_terms(kernel - offset)
+        if rest is not None and len(rest) < MAX_SEPARABLE_RANK:
+            candidates.append([(np.full(shape[0], offset), np.ones(shape[1]))] + rest)
+
+    best = None
+    for terms in candidates:
+        if not terms:
+            continue
+        for column, row in terms:
+            # Snap factors that are constant up to SVD noise, so they take the moving-sum path.
+            for factor in (column, row):
+                if np.allclose(factor, factor[0], rtol=1e-12, atol=0):
+                    factor[:] = factor.mean()
+        if not np.allclose(sum(np.outer(c, r) for c, r in terms), kernel,
+                           rtol=0, atol=1e-12 * np.abs(kernel).max()):
+            continue
+        if best is None or _terms_cost(terms) < _terms_cost(best):
+            best = terms
+    return None if best is None else tuple(best)
+
+
+def _factor_cost(factor: np.ndarray) -> int:
+    return 3 if np.all(factor == factor[0]) else len(factor)
+
+
+def _terms_cost(terms) -> int:
+    return sum(_factor_cost(column) + _factor_cost(row) + 1 for column, row in terms)
+
+
+def choose_strategy(kernel: np.ndarray, grid_shape: Tuple[int, int]) -> str:
+    """
+    The cheapest of "direct", "separable" and "fft" for a kernel, by multiply-adds per pixel.
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    costs = {"direct": int(np.count_nonzero(kernel))}
+    terms = _separable_terms(_kernel_key(kernel))
+    if terms is not None:
+        costs["separable"] = _terms_cost(terms)
+    padded = (grid_shape[0] + kernel.shape[0] - 1) * (grid_shape[1] + kernel.shape[1] - 1)
+    costs["fft"] = FFT_COST_PER_LOG2 * int(np.log2(padded))
+    return min(costs, key=costs.get)
+
+
+def _moving_sum(array: np.ndarray, length: int, axis: int) -> np.ndarray:
+    # ndimage aligns a length-L kernel so output i sums x[i - (L - 1 - L // 2) .. i + L // 2], zeros outside.
+    after = length // 2
+    before = length - 1 - after
+    n = array.shape[axis]
+    pad = [(0, 0)] * array.ndim
+    pad[axis] = (before + 1, after)
+    sums = np.cumsum(np.pad(array, pad), axis=axis)
+    upper = [slice(None)] * array.ndim
+    lower = [slice(None)] * array.ndim
+    upper[axis] = slice(length, length + n)
+    lower[axis] = slice(0, n)
+    return sums[tuple(upper)] - sums[tuple(lower)]
+
+
+def _convolve_1d(array: np.ndarray, factor: np.ndarray, axis: int) -> np.ndarray:
+    if np.all(factor == factor[0]):
+        return _moving_sum(array, len(factor), axis) * factor[0]
+    return ndimage.convolve1d(array, factor, axis=axis, mode='constant', cval=0)
+
+
+def _separable(array: np.ndarray, terms: Terms) -> np.ndarray:
+    total = None
+    for column, row in terms:
+        term = _convolve_1d(_convolve_1d(array, column, axis=-2), row, axis=-1)
+        total = term if total is None else total + term
+    return total
+
+
+def _fft(array: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    kh, kw = kernel.shape
+    height, width = array.shape[-2:]
+    full = signal.fftconvolve(array, kernel.reshape((1,) * (array.ndim - 2) + kernel.shape), mode='full',
+                              axes=(-2, -1))
+    return full[..., kh // 2:kh // 2 + height, kw // 2:kw // 2 + width]
+
+
+def _run(array: np.ndarray, kernel: np.ndarray, strategy: str) -> np.ndarray:
+    # array is float64 without NaN here.
+    if strategy == "separable":
+        return _separable(array, _separable_terms(_kernel_key(kernel)))
+    return _fft(array, kernel)
+
+
+def convolve(array: np.ndarray, kernel: np.ndarray, strategy: Optional[str] = None) -> np.ndarray:
+    """
+    ndimage.convolve(array, kernel, mode='constant', cval=0) of a [..., rows, columns] array, convolving
+    only the last two axes. strategy forces "direct", "separable" or "fft" instead of choose_strategy.
+    """
+    array = np.asarray(array)
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if strategy is None:
+        strategy = choose_strategy(kernel, array.shape[-2:]) if array.dtype.kind == 'f' else "direct"
+    if strategy == "direct":
+        return ndimage.convolve(array, kernel.reshape((1,) * (array.ndim - 2) + kernel.shape),
+                                mode='constant', cval=0)
+    if strategy == "separable" and _separable_terms(_kernel_key(kernel)) is None:
+        raise ValueError("Kernel does not split into few enough separable terms")
+    if strategy not in ("separable", "fft"):
+        raise ValueError(f"Unknown convolution strategy: {strategy}")
+
+    values = array.astype(np.float64)
+    missing = np.isnan(values)
+    values[missing] = 0
+    result = _run(values, kernel, strategy)
+
+    # Rounding noise (from the FFT, or the differences of cumulative sums) must not turn a pixel whose
+    # footprint only holds zeros into a tiny nonzero value. Counting nonzero and NaN pixels under the
+    # footprint is exact (small integers), and both counts come from one batched pass.
+    footprint = (kernel != 0).astype(np.float64)
+    footprint_strategy = "separable" if _separable_terms(_kernel_key(footprint)) is not None else "fft"
+    masks = np.stack([values != 0, missing] if missing.any() else [values != 0]).astype(np.float32)
+    counts = _run(masks, footprint, footprint_strategy)
+    result[counts[0] < 0.5] = 0
+    if len(counts) > 1:
+        result[counts[1] > 0.5] = np.nan
+    return result.astype(array.dtype, copy=False)
+
+
+def convolve_many(arrays: List[np.ndarray], kernel: np.ndarray) -> List[np.ndarray]:
+    """
+    Convolve several same-shaped grids with one kernel, batched into a single call unless the kernel
+    is small enough for ndimage (where stacking would only add a copy).
+    """
+    if arrays[0].dtype.kind != 'f' or choose_strategy(kernel, arrays[0].shape[-2:]) == "direct":
+        return [convolve(array, kernel, "direct") for array in arrays]
+    return list(convolve(np.stack(arrays), kernel))
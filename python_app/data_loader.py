@@ -2,9 +2,16 @@ import math
 import os
 import glob
 import re
-from typing import Union
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
-import geopandas as gpd
 import numpy as np
 import rasterio
 from affine import Affine
@@ -12,12 +19,22 @@ from rasterio import CRS
 from rasterio.enums import Resampling
 from rasterio.warp import reproject, calculate_default_transform
 
+from python_app import grid_cache
+from python_app.compact import CompactStack, Encoding, encode
 
-def load_vector_dataset(shp_path_name: str) -> gpd.GeoDataFrame:
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+    from python_app.window_reader import WindowedStack
+
+
+def load_vector_dataset(shp_path_name: str) -> "gpd.GeoDataFrame":
     """
     Load all shapefiles in the given dataset folder.
     Returns a dict mapping the base name of the shapefile to its GeoDataFrame.
     """
+    # geopandas (and pandas) are only needed for vector data; importing them lazily keeps startup fast.
+    import geopandas as gpd
     try:
         gdf = gpd.read_file(shp_path_name)
     except Exception as e:
@@ -25,36 +42,62 @@ def load_vector_dataset(shp_path_name: str) -> gpd.GeoDataFrame:
     return gdf
 
 
-#ALL dataset have only one band
-def load_and_convert_raster_dataset(dataset_path: str) -> dict:
-    raster_layers = {}
-    tif_files = glob.glob(os.path.join(dataset_path, "*.tif"))
-    for tif in tif_files:
-        base_name = os.path.splitext(os.path.basename(tif))[0]
+# Reading and warping GeoTIFFs is GDAL work that releases the GIL, so files (and whole datasets at warm-up)
+# are ingested on threads. WARP_THREADS is GDAL's own thread count inside each read/warp; the default
+# splits the cores between the two levels instead of oversubscribing them.
+INGEST_THREADS = int(os.environ.get("INGEST_THREADS", os.cpu_count() or 4))
+WARP_THREADS = int(os.environ.get("WARP_THREADS", max(1, (os.cpu_count() or 1) // INGEST_THREADS)))
+
+_ingest_executor: Optional[ThreadPoolExecutor] = None
+_ingest_executor_lock = threading.Lock()
+
+
+def ingest_map(func: Callable, items) -> list:
+    """
+    [func(item) for item in items], run on the shared ingestion thread pool inside a rasterio.Env
+    configured with WARP_THREADS. func must not itself wait on ingest_map.
+    """
+    global _ingest_executor
+    with _ingest_executor_lock:
+        if _ingest_executor is None:
+            _ingest_executor = ThreadPoolExecutor(max_workers=INGEST_THREADS, thread_name_prefix="ingest")
+
+    def run(item):
+        with rasterio.Env(GDAL_NUM_THREADS=WARP_THREADS):
+            return func(item)
+
+    return list(_ingest_executor.map(run, items))
+
+
+def _load_raster_files(dataset_path: str, out_dtype: Optional[str] = None) -> dict:
+    def load(tif):
         try:
             with rasterio.open(tif) as src:
-                array = src.read(1)
+                # Decoding straight into out_dtype avoids a second full-size copy of every file.
+                array = src.read(1, out_dtype=out_dtype)
                 meta = src.meta.copy()
-            raster_layers[base_name] = {"array": array, "meta": meta}
+            if out_dtype is not None:
+                meta.update(dtype=out_dtype)
+            return {"array": array, "meta": meta}
         except Exception as e:
             print(f"Error loading raster {tif}: {e}")
+            return None
+
+    tif_files = glob.glob(os.path.join(dataset_path, "*.tif"))
+    raster_layers = {}
+    for tif, layer in zip(tif_files, ingest_map(load, tif_files)):
+        if layer is not None:
+            raster_layers[os.path.splitext(os.path.basename(tif))[0]] = layer
     return raster_layers
 
 
+#ALL dataset have only one band
+def load_and_convert_raster_dataset(dataset_path: str) -> dict:
+    return _load_raster_files(dataset_path)
+
+
 def load_and_convert_raster_dataset_as_f32(dataset_path: str) -> dict:
-    raster_layers = {}
-    tif_files = glob.glob(os.path.join(dataset_path, "*.tif"))
-    for tif in tif_files:
-        base_name = os.path.splitext(os.path.basename(tif))[0]
-        try:
-            with rasterio.open(tif) as src:
-                array = src.read(1).astype(np.float32)
-                meta = src.meta.copy()
-                meta.update(dtype="float32")
-            raster_layers[base_name] = {"array": array, "meta": meta}
-        except Exception as e:
-            print(f"Error loading raster {tif}: {e}")
-    return raster_layers
+    return _load_raster_files(dataset_path, out_dtype="float32")
 
 
 def check_important_meta_consistency(raster_layers: dict, keys=["crs", "transform", "width", "height"],
@@ -231,7 +274,8 @@ def reproject_raster_layer_to_common_grid(src_array, src_meta, resampling_method
         dst_crs=target_crs,
         resampling=resampling_method,
         src_nodata=src_meta.get("nodata"),
-        dst_nodata=dst_nodata
+        dst_nodata=dst_nodata,
+        num_threads=WARP_THREADS,
     )
 
     return dst_array, dst_meta
@@ -244,11 +288,11 @@ def convert_all_raster_layers_to_common_grid(raster_layers: dict, resampling_met
     Returns:
       - A new dictionary with reprojected raster arrays and updated metadata.
     """
+    def convert(data):
+        return reproject_raster_layer_to_common_grid(data["array"], data["meta"], resampling_method)
+
     new_layers = {}
-    for name, data in raster_layers.items():
-        src_array = data["array"]
-        src_meta = data["meta"]
-        dst_array, dst_meta = reproject_raster_layer_to_common_grid(src_array, src_meta, resampling_method)
+    for name, (dst_array, dst_meta) in zip(raster_layers, ingest_map(convert, raster_layers.values())):
         new_layers[name] = {"array": dst_array, "meta": dst_meta}
     return new_layers
 
@@ -264,6 +308,201 @@ class DataStruct:
         self.dtype = dtype
 
 
+def nodata_equals(array: np.ndarray, nodata: Union[int, float]) -> np.ndarray:
+    return array == nodata
+
+
+def gpp_fill_values(array: np.ndarray, nodata: Union[int, float]) -> np.ndarray:
+    # MODIS GPP uses 65529..65535 as fill codes; every valid value is below 6500.
+    return array >= 6500
+
+
+STAT_PERCENTILES = (1, 5, 50, 95, 99)
+
+
+@dataclass(frozen=True)
+class LayerStats:
+    global_min: float
+    global_max: float
+    year_max: Tuple[float, ...]
+    percentiles: Dict[int, float]
+
+
+@dataclass(frozen=True)
+class MaskedLayer:
+    """
+    A [year, rows, columns] stack with nodata replaced by NaN, plus its colour-scale statistics.
+    The array is read-only; renderers slice it per request and never copy the full stack.
+    """
+    name: str
+    array: np.ndarray
+    stats: LayerStats
+
+
+def build_masked_layer(name: str, datastruct: DataStruct,
+                       nodata_rule: Callable[[np.ndarray, Union[int, float]], np.ndarray] = nodata_equals
+                       ) -> MaskedLayer:
+    data = datastruct.array
+    masked = np.where(nodata_rule(data, datastruct.nodata), np.nan, data)
+    masked.flags.writeable = False
+    return MaskedLayer(name=name, array=masked, stats=layer_stats(masked))
+
+
+def layer_stats(masked: np.ndarray) -> LayerStats:
+    with warnings.catch_warnings():
+        # Years without a single valid pixel simply report NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        year_max = tuple(float(v) for v in np.nanmax(masked, axis=(1, 2)))
+        values = np.nanpercentile(masked, STAT_PERCENTILES)
+        return LayerStats(
+            global_min=float(np.nanmin(masked)),
+            global_max=float(np.nanmax(masked)),
+            year_max=year_max,
+            percentiles=MappingProxyType({p: float(v) for p, v in zip(STAT_PERCENTILES, values)}),
+        )
+
+
+def _stats_meta(stats: LayerStats) -> dict:
+    return {"global_min": stats.global_min, "global_max": stats.global_max, "year_max": list(stats.year_max), "percentiles": dict(stats.percentiles)}
+
+
+def _stats_from_meta(meta: dict) -> LayerStats:
+    return LayerStats(
+        global_min=meta["global_min"],
+        global_max=meta["global_max"],
+        year_max=tuple(meta["year_max"]),
+        percentiles=MappingProxyType({int(p): v for p, v in meta["percentiles"].items()}),
+    )
+
+
+@dataclass(frozen=True)
+class SummedArea:
+    """
+    Summed-area tables of a masked [year, rows, columns] stack, zero-padded to [year, rows + 1, columns + 1]:
+    sums[y, r, c] is the sum of the valid (non-NaN) pixels above and left of (r, c), counts their number.
+    Any axis-aligned window total is then four lookups, whatever the window size.
+    """
+    sums: np.ndarray
+    counts: np.ndarray
+
+
+def build_summed_area(masked: np.ndarray) -> SummedArea:
+    n_years, rows, cols = masked.shape
+    valid = np.isfinite(masked)
+    sums = np.zeros((n_years, rows + 1, cols + 1), dtype=np.float64)
+    counts = np.zeros((n_years, rows + 1, cols + 1), dtype=np.int32)
+    np.cumsum(np.where(valid, masked, 0), axis=1, dtype=np.float64, out=sums[:, 1:, 1:])
+    np.cumsum(sums[:, 1:, 1:], axis=2, out=sums[:, 1:, 1:])
+    np.cumsum(valid, axis=1, dtype=np.int32, out=counts[:, 1:, 1:])
+    np.cumsum(counts[:, 1:, 1:], axis=2, out=counts[:, 1:, 1:])
+    sums.flags.writeable = False
+    counts.flags.writeable = False
+    return SummedArea(sums=sums, counts=counts)
+
+
+def cached_summed_area(name: str, source_key: str, masked: Callable[[], np.ndarray]) -> SummedArea:
+    """
+    Return the summed-area tables published in the grid cache, building them from masked() on a miss.
+    """
+    def build_entry():
+        table = build_summed_area(masked())
+        return {"sums": table.sums, "counts": table.counts}, {}
+
+    key = grid_cache.cache_key("summed_area", source_key)
+    arrays, _ = grid_cache.shared_arrays(f"summed_area_{name}", key, build_entry)
+    return SummedArea(sums=arrays["sums"], counts=arrays["counts"])
+
+
+# Overview levels halve the grid until its shorter side would drop below this many pixels.
+OVERVIEW_MIN_SIZE = 16
+
+
+@dataclass(frozen=True)
+class Overview:
+    """
+    A decimated copy of a [year, rows, columns] stack: each pixel covers factor x factor grid pixels
+    (the mean of their valid values for continuous data, the most frequent class for categorical data).
+    """
+    factor: int
+    array: np.ndarray
+    transform: Affine
+
+
+def _block_sum(array: np.ndarray) -> np.ndarray:
+    # Sum 2x2 blocks over the last two axes, zero-padding odd sizes.
+    rows, cols = array.shape[-2:]
+    if rows % 2 or cols % 2:
+        pad = [(0, 0)] * (array.ndim - 2) + [(0, rows % 2), (0, cols % 2)]
+        array = np.pad(array, pad)
+    shape = array.shape[:-2] + (array.shape[-2] // 2, 2, array.shape[-1] // 2, 2)
+    return array.reshape(shape).sum(axis=(-3, -1), dtype=array.dtype)
+
+
+def build_overviews(stack: np.ndarray, categorical: bool = False, nodata=None) -> Dict[int, np.ndarray]:
+    """
+    Return {factor: decimated stack} for factors 2, 4, 8, ...
+
+    The stack is read one year at a time, so a lazy (windowed) stack never has more than one year
+    in memory besides the levels themselves (a third of the stack at most).
+    """
+    levels = {}
+    for year in range(len(stack)):
+        for factor, level in _year_overviews(np.asarray(stack[year]), categorical, nodata).items():
+            if factor not in levels:
+                levels[factor] = np.empty((len(stack),) + level.shape, dtype=level.dtype)
+            levels[factor][year] = level
+    for level in levels.values():
+        level.flags.writeable = False
+    return levels
+
+
+def _year_overviews(stack: np.ndarray, categorical: bool, nodata) -> Dict[int, np.ndarray]:
+    """
+    build_overviews of one [rows, columns] grid.
+
+    Levels are built from per-block sums and valid counts (per-class counts for categorical data)
+    carried down from the level above, so every level is exact with respect to the full grid.
+    """
+    levels = {}
+    if categorical:
+        classes = np.unique(stack[stack != nodata])
+        counts = np.stack([stack == c for c in classes]).astype(np.uint16)
+    else:
+        valid = np.isfinite(stack)
+        sums = np.where(valid, stack, 0).astype(np.float64)
+        counts = valid.astype(np.int32)
+
+    factor = 1
+    while min(stack.shape[-2:]) // (factor * 2) >= OVERVIEW_MIN_SIZE:
+        factor *= 2
+        counts = _block_sum(counts)
+        if categorical:
+            level = classes[np.argmax(counts, axis=0)].astype(stack.dtype)
+            level[counts.sum(axis=0) == 0] = nodata
+        else:
+            sums = _block_sum(sums)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                level = (sums / counts).astype(stack.dtype)
+        levels[factor] = level
+    return levels
+
+
+def cached_overviews(name: str, source_key: str, stack: Callable[[], np.ndarray], categorical: bool = False,
+                     nodata=None) -> Tuple[Overview, ...]:
+    """
+    Return the overview levels published in the grid cache, coarsest last, building them from stack() on a miss.
+    """
+    def build_entry():
+        levels = build_overviews(stack(), categorical, nodata)
+        return {f"x{factor}": level for factor, level in levels.items()}, {"factors": list(levels)}
+
+    key = grid_cache.cache_key("overviews", source_key, categorical, nodata, OVERVIEW_MIN_SIZE)
+    arrays, meta = grid_cache.shared_arrays(f"overviews_{name}", key, build_entry)
+    return tuple(Overview(factor=factor, array=arrays[f"x{factor}"],
+                          transform=common_grid["transform"] * Affine.scale(factor))
+                 for factor in meta["factors"])
+
+
 def extract_year_from_key(key: str) -> int:
     """
     Extract a 4-digit year from a string such as 'Assaba_Pop_2010.tif' or '2010R.tif'.
@@ -307,6 +546,20 @@ def convert_modis_land_cover(data: dict) -> DataStruct:
     return DataStruct(nodata=255, array=stacked_array, dtype=np.uint8)
 
 
+def _interpolation_source(sorted_years, y: int) -> Tuple[int, int]:
+    """
+    The two known years a missing year is interpolated (or extrapolated) from.
+    """
+    if y < sorted_years[0]:
+        return sorted_years[0], sorted_years[1]
+    if y > sorted_years[-1]:
+        return sorted_years[-2], sorted_years[-1]
+    for i in range(1, len(sorted_years)):
+        if sorted_years[i] > y:
+            return sorted_years[i - 1], sorted_years[i]
+    return sorted_years[-2], sorted_years[-1]
+
+
 def convert_standard_set_with_interpolation(
         data: dict,
         start_year: int = 2010,
@@ -316,6 +569,9 @@ def convert_standard_set_with_interpolation(
     Given a dictionary with string keys (e.g., 'Assaba_Pop_2010.tif'),
     parse out the year, linearly interpolate missing years, and
     return a DataStruct with a year-by-year stack from start_year to end_year.
+
+    The stack is allocated once and every year is written into it in place. A pixel that is
+    nodata in either year it is interpolated from stays nodata instead of being blended.
     """
     year_dict = {}
     for key, value in data.items():
@@ -325,85 +581,511 @@ def convert_standard_set_with_interpolation(
     sorted_years = sorted(year_dict.keys())
 
     nodata = year_dict[sorted_years[0]]['meta']['nodata']
-    dtype = year_dict[sorted_years[0]]['meta']['dtype']
-
-    def get_array_for_year(y: int) -> np.ndarray:
+    # Interpolated values are fractional even when the source years are integers.
+    dtype = np.result_type(year_dict[sorted_years[0]]['meta']['dtype'], np.float32)
+
+    stacked_array = np.empty((end_year - start_year + 1,) + year_dict[sorted_years[0]]['array'].shape, dtype=dtype)
+    is_nodata = np.empty(stacked_array.shape[1:], dtype=bool)
+    scratch = np.empty(stacked_array.shape[1:], dtype=bool)
+
+    def mark_nodata(array, out):
+        if nodata is None:
+            out.fill(False)
+            return out
+        if np.isnan(nodata):
+            return np.isnan(array, out=out)
+        return np.equal(array, nodata, out=out)
+
+    for out, y in zip(stacked_array, range(start_year, end_year + 1)):
         if y in year_dict:
             # Exact data for this year
-            return year_dict[y]['array']
-        if y < sorted_years[0]:
-            y1, y2 = sorted_years[0], sorted_years[1]
-            arr1, arr2 = year_dict[y1]['array'], year_dict[y2]['array']
-            ratio = (y - y1) / (y2 - y1)  # will be negative
-            return arr1 + ratio * (arr2 - arr1)
-
-        if y > sorted_years[-1]:
-            y1, y2 = sorted_years[-2], sorted_years[-1]
-            arr1, arr2 = year_dict[y1]['array'], year_dict[y2]['array']
-            ratio = (y - y1) / (y2 - y1)
-            return arr2 + ratio * (arr2 - arr1)
-
-        for i in range(1, len(sorted_years)):
-            if sorted_years[i] > y:
-                y1, y2 = sorted_years[i - 1], sorted_years[i]
-                arr1, arr2 = year_dict[y1]['array'], year_dict[y2]['array']
-                ratio = (y - y1) / (y2 - y1)
-                return arr1 + ratio * (arr2 - arr1)
-
-        return year_dict[sorted_years[-1]]['array']
-
-    yearly_arrays = []
-    for y in range(start_year, end_year + 1):
-        arr = get_array_for_year(y)
-        yearly_arrays.append(arr)
-    stacked_array = np.stack(yearly_arrays, axis=0)
+            np.copyto(out, year_dict[y]['array'], casting='unsafe')
+            continue
+        if len(sorted_years) == 1:
+            np.copyto(out, year_dict[sorted_years[0]]['array'], casting='unsafe')
+            continue
+
+        y1, y2 = _interpolation_source(sorted_years, y)
+        arr1, arr2 = year_dict[y1]['array'], year_dict[y2]['array']
+        # Extrapolating past the last year starts from it; the ratio is then relative to y2.
+        base, ratio = (arr2, (y - y2) / (y2 - y1)) if y > y2 else (arr1, (y - y1) / (y2 - y1))
+        np.subtract(arr2, arr1, out=out, casting='unsafe')
+        np.multiply(out, dtype.type(ratio), out=out)
+        np.add(out, base, out=out, casting='unsafe')
+
+        mark_nodata(arr1, is_nodata)
+        np.logical_or(is_nodata, mark_nodata(arr2, scratch), out=is_nodata)
+        if nodata is not None:
+            out[is_nodata] = nodata
 
     return DataStruct(nodata=nodata, array=stacked_array, dtype=dtype)
 
 
-modis_land_dataset_path = "./python_app/datasets/Modis_Land_Cover_Data"
-modis_land_raster_layers = load_and_convert_raster_dataset(modis_land_dataset_path)
-check_important_meta_consistency(modis_land_raster_layers)
-modis_land_raster_datastruct = convert_modis_land_cover(modis_land_raster_layers)
-
-modis_mask = (modis_land_raster_datastruct.array == 255)
-
-
-modis_gpp_dataset_path = "./python_app/datasets/MODIS_Gross_Primary_Production_GPP"
-modis_gpp_raster_layers = load_and_convert_raster_dataset_as_f32(modis_gpp_dataset_path)
-check_important_meta_consistency(modis_gpp_raster_layers)
-modis_gpp_datastruct = convert_standard_set(modis_gpp_raster_layers)
-
-climate_precipitation_dataset_path = "./python_app/datasets/Climate_Precipitation_Data"
-climate_precipitation_raster_layers = convert_all_raster_layers_to_common_grid(
-    load_and_convert_raster_dataset(climate_precipitation_dataset_path))
-check_important_meta_consistency(climate_precipitation_raster_layers)
-climate_precipitation_datastruct = convert_standard_set(climate_precipitation_raster_layers)
-
-population_density_dataset_path = "./python_app/datasets/Gridded_Population_Density_Data"
-population_density_raster_layers = convert_all_raster_layers_to_common_grid(
-    load_and_convert_raster_dataset(population_density_dataset_path))
-check_important_meta_consistency(population_density_raster_layers)
-population_density_datastruct = convert_standard_set_with_interpolation(population_density_raster_layers)
-
-glw_sheep_dataset_path = "./python_app/datasets/GLW_Sheep"
-glw_sheep_raster_layers = convert_all_raster_layers_to_common_grid(
-    load_and_convert_raster_dataset(glw_sheep_dataset_path))
-check_important_meta_consistency(glw_sheep_raster_layers)
-glw_sheep_datastruct = convert_standard_set_with_interpolation(glw_sheep_raster_layers)
-sheep_default_value = glw_sheep_datastruct.nodata
-glw_sheep_datastruct.array[modis_mask] = sheep_default_value
-
-glw_goat_dataset_path = "./python_app/datasets/GLW_Goats"
-glw_goat_raster_layers = convert_all_raster_layers_to_common_grid(
-    load_and_convert_raster_dataset(glw_goat_dataset_path))
-check_important_meta_consistency(glw_goat_raster_layers)
-glw_goat_datastruct = convert_standard_set_with_interpolation(glw_goat_raster_layers)
-
-glw_cattle_dataset_path = "./python_app/datasets/GLW_Cattle"
-glw_cattle_raster_layers = convert_all_raster_layers_to_common_grid(
-    load_and_convert_raster_dataset(glw_cattle_dataset_path))
-check_important_meta_consistency(glw_cattle_raster_layers)
-glw_cattle_datastruct = convert_standard_set_with_interpolation(glw_cattle_raster_layers)
-
-#print(dl.modis_land_raster_layers['2010LCT']["meta"])
+_MISSING = object()
+
+
+class OnceCache:
+    """
+    Thread-safe memo: build() runs at most once per key, concurrent callers for the same key wait for it.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build: Callable[[], object]):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Keep the value in a local: retain() on another thread may drop the key at any moment.
+            value = self._values.get(key, _MISSING)
+            if value is _MISSING:
+                value = self._values[key] = build()
+        return value
+
+    def __contains__(self, key) -> bool:
+        return key in self._values
+
+    def retain(self, keep: Callable[[object], bool]):
+        """
+        Forget every value whose key keep() rejects.
+        """
+        with self._lock:
+            for key in [key for key in self._values if not keep(key)]:
+                del self._values[key]
+                self._locks.pop(key, None)
+
+
+def _grid_signature() -> tuple:
+    return (common_grid["crs"].to_wkt(), tuple(common_grid["transform"]), common_grid["width"],
+            common_grid["height"], common_grid["nodata"])
+
+
+def dataset_cache_key(name: str, *dataset_paths: str) -> str:
+    """
+    Cache key of a dataset stack: the common grid plus a fingerprint of every source folder it is built from.
+    """
+    return grid_cache.cache_key(name, _grid_signature(),
+                                *[grid_cache.folder_fingerprint(path) for path in dataset_paths])
+
+
+def cached_datastruct(name: str, key: str, build: Callable[[], DataStruct]) -> DataStruct:
+    """
+    Return the DataStruct published in the grid cache, building and publishing it on a miss.
+    Cached arrays are memory-mapped read-only and shared by every worker process.
+    """
+    def build_entry():
+        datastruct = build()
+        return {"array": datastruct.array}, {"nodata": datastruct.nodata, "dtype": np.dtype(datastruct.dtype).str}
+
+    arrays, meta = grid_cache.shared_arrays(name, key, build_entry)
+    return DataStruct(nodata=meta["nodata"], array=arrays["array"], dtype=np.dtype(meta["dtype"]))
+
+
+def cached_masked_layer(name: str, source_key: str, datastruct: DataStruct,
+                        nodata_rule: Callable[[np.ndarray, Union[int, float]], np.ndarray] = nodata_equals
+                        ) -> MaskedLayer:
+    def build_entry():
+        layer = build_masked_layer(name, datastruct, nodata_rule)
+        return {"array": layer.array}, _stats_meta(layer.stats)
+
+    key = grid_cache.cache_key("masked", source_key, nodata_rule.__name__, STAT_PERCENTILES)
+    arrays, stats = grid_cache.shared_arrays(f"masked_{name}", key, build_entry)
+    return MaskedLayer(name=name, array=arrays["array"], stats=_stats_from_meta(stats))
+
+
+def cached_compact_layer(name: str, source_key: str, build: Callable[[], DataStruct],
+                         nodata_rule: Optional[Callable[[np.ndarray, Union[int, float]], np.ndarray]] = None
+                         ) -> Tuple[DataStruct, Optional[MaskedLayer]]:
+    """
+    Return a dataset stored as integer codes in the grid cache (see compact), building it on a miss.
+    Its DataStruct and, with a nodata_rule, its MaskedLayer are lazy views of the same codes; the
+    float stack only exists while building.
+    """
+    def build_entry():
+        datastruct = build()
+        data = datastruct.array
+        special = data == datastruct.nodata if nodata_rule is None else nodata_rule(data, datastruct.nodata)
+        encoding = encode(data, special)
+        meta = {"nodata": datastruct.nodata, "dtype": np.dtype(datastruct.dtype).str,
+                "scale": encoding.scale.tolist(), "offset": encoding.offset.tolist(),
+                "specials": list(encoding.specials), "max_error": encoding.max_error}
+        if nodata_rule is not None:
+            meta["stats"] = _stats_meta(layer_stats(np.asarray(CompactStack(encoding, masked=True))))
+        replaced = data.nbytes * (1 if nodata_rule is None else 2)
+        print(f"{name}: stored as {encoding.codes.dtype} codes, {encoding.codes.nbytes / 1e6:.1f} MB instead of "
+              f"{replaced / 1e6:.1f} MB, max error {encoding.max_error:.3g}")
+        return {"codes": encoding.codes}, meta
+
+    key = grid_cache.cache_key("compact", source_key, nodata_rule and nodata_rule.__name__, STAT_PERCENTILES)
+    arrays, meta = grid_cache.shared_arrays(f"compact_{name}", key, build_entry)
+    encoding = Encoding(codes=arrays["codes"], scale=np.array(meta["scale"]), offset=np.array(meta["offset"]),
+                        specials=tuple(meta["specials"]), dtype=np.dtype(meta["dtype"]), max_error=meta["max_error"])
+    datastruct = DataStruct(nodata=meta["nodata"], array=CompactStack(encoding, masked=False), dtype=encoding.dtype)
+    if nodata_rule is None:
+        return datastruct, None
+    return datastruct, MaskedLayer(name=name, array=CompactStack(encoding, masked=True),
+                                   stats=_stats_from_meta(meta["stats"]))
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """
+    Declaration of one raster dataset folder and how it is brought onto the common grid.
+
+    - read: loader for the GeoTIFFs of the folder.
+    - resampling: method used to reproject onto common_grid, or None if the files already use it.
+    - stack: how the per-year files become a [year, rows, columns] DataStruct; this is where the
+      interpolation policy lives (convert_standard_set, convert_standard_set_with_interpolation,
+      convert_modis_land_cover).
+    - nodata_rule: which values become NaN in the masked stack; None for categorical data.
+    - mask_with: dataset whose nodata pixels are also set to nodata in this one.
+    """
+    path: str
+    read: Callable[[str], dict] = load_and_convert_raster_dataset
+    resampling: Optional[Resampling] = None
+    stack: Callable[[dict], DataStruct] = convert_standard_set
+    nodata_rule: Optional[Callable[[np.ndarray, Union[int, float]], np.ndarray]] = nodata_equals
+    mask_with: Optional[str] = None
+
+
+class RegistryState(NamedTuple):
+    """
+    One published generation of the registry.
+
+    - keys: dataset name -> cache key of the stack it serves (added as datasets are first used).
+    - derived: grids computed from the datasets by higher layers (analytics), published with them.
+
+    A reload never changes a state in place; it publishes a new one with the next generation.
+    """
+    generation: int
+    keys: Dict[str, str]
+    derived: Dict[str, object]
+
+
+class LayerRegistry:
+    """
+    The declared datasets, each loaded (or attached from the grid cache) on first access only.
+
+    Access is thread-safe and every dataset, masked stack and cache key is built at most once per
+    process. Nothing is read at import time; warm_up() loads everything ahead of the first request.
+
+    Everything is looked up through the current RegistryState, which reload() replaces when source
+    folders change. Code running inside pinned() keeps the state it pinned, so a request started
+    before a reload finishes on the data it started with.
+    """
+
+    def __init__(self, specs: Dict[str, DatasetSpec]):
+        self.specs = MappingProxyType(dict(specs))
+        self._values = OnceCache()
+        self._state = RegistryState(generation=0, keys={}, derived={})
+        self._previous = self._state
+        self._pinned: ContextVar[Optional[RegistryState]] = ContextVar("pinned_registry_state", default=None)
+        self._reload_lock = threading.Lock()
+        self._reload_hooks: List[Callable[[RegistryState], object]] = []
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self.specs.keys())
+
+    def spec(self, name: str) -> DatasetSpec:
+        try:
+            return self.specs[name]
+        except KeyError:
+            raise ValueError(f"Unknown dataset: {name}")
+
+    def dataset_paths(self, name: str) -> Tuple[str, ...]:
+        """
+        Every folder the dataset is derived from, including the datasets it is masked with.
+        """
+        spec = self.spec(name)
+        if spec.mask_with is None:
+            return (spec.path,)
+        return (spec.path,) + self.dataset_paths(spec.mask_with)
+
+    def state(self) -> RegistryState:
+        """
+        The state pinned by the calling context, or the current one.
+        """
+        return self._pinned.get() or self._state
+
+    @property
+    def generation(self) -> int:
+        return self.state().generation
+
+    @contextmanager
+    def pinned(self, state: Optional[RegistryState] = None):
+        """
+        Serve every lookup in this context (and in contexts copied from it) from one state,
+        the current one by default.
+        """
+        token = self._pinned.set(state or self.state())
+        try:
+            yield
+        finally:
+            self._pinned.reset(token)
+
+    def key(self, name: str) -> str:
+        keys = self.state().keys
+        key = keys.get(name)
+        if key is None:
+            # A dataset keyed for the first time joins its state: the key is what is on disk now.
+            key = keys.setdefault(name, dataset_cache_key(name, *self.dataset_paths(name)))
+        return key
+
+    def publish_derived(self, name: str, value) -> object:
+        """
+        Attach a derived grid to the state in use, unless one was attached first; returns the attached one.
+        """
+        return self.state().derived.setdefault(name, value)
+
+    def add_reload_hook(self, hook: Callable[[RegistryState], object]):
+        """
+        Call hook(previous_state) during every reload, with the new state pinned, before it is published.
+        """
+        self._reload_hooks.append(hook)
+
+    def datastruct(self, name: str) -> DataStruct:
+        if name in COMPACT_DATASETS:
+            return self._compact(name)[0]
+        key = self.key(name)
+        return self._values.get(("datastruct", name, key),
+                                lambda: cached_datastruct(name, key, lambda: self._build(name)))
+
+    def _compact(self, name: str) -> Tuple[DataStruct, Optional[MaskedLayer]]:
+        key = self.key(name)
+        return self._values.get(("compact", name, key), lambda: cached_compact_layer(
+            name, key, lambda: self._build(name), self.spec(name).nodata_rule))
+
+    def masked(self, name: str) -> MaskedLayer:
+        spec = self.spec(name)
+        if spec.nodata_rule is None:
+            raise ValueError(f"Dataset {name} is categorical and has no masked stack")
+        key = self.key(name)
+        if name in WINDOWED_DATASETS:
+            return self._values.get(("masked", name, key), lambda: self._windowed_masked(name))
+        if name in COMPACT_DATASETS:
+            return self._compact(name)[1]
+        return self._values.get(("masked", name, key), lambda: cached_masked_layer(
+            name, key, self.datastruct(name), spec.nodata_rule))
+
+    def windowed(self, name: str) -> "WindowedStack":
+        """
+        The masked stack of a dataset read lazily from its GeoTIFFs, block by block, instead of loaded in full.
+        Only datasets whose files are already on the common grid and stacked as they are can be read this way.
+        """
+        spec = self.spec(name)
+        if spec.resampling is not None or spec.stack is not convert_standard_set or spec.nodata_rule is None \
+                or spec.mask_with is not None:
+            raise ValueError(f"Dataset {name} is not stored on the common grid and cannot be read windowed")
+
+        def build():
+            from python_app.window_reader import WindowedRaster, WindowedStack
+
+            paths = sorted(glob.glob(os.path.join(spec.path, "*.tif")),
+                           key=lambda path: os.path.splitext(os.path.basename(path))[0])
+            rasters = [WindowedRaster(path) for path in paths]
+            if not check_important_meta_consistency({str(i): {"meta": {
+                "crs": raster.crs, "transform": raster.transform, "width": raster.width, "height": raster.height,
+            }} for i, raster in enumerate(rasters)}):
+                raise ValueError(f"Dataset {name}: the files in {spec.path} are not on one grid")
+            return WindowedStack(rasters, spec.nodata_rule, rasters[0].nodata)
+
+        return self._values.get(("windowed", name, self.key(name)), build)
+
+    def _windowed_masked(self, name: str) -> MaskedLayer:
+        stack = self.windowed(name)
+
+        def build_entry():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                year_min, year_max = stack.year_extrema()
+                return {}, {"global_min": float(np.nanmin(year_min)), "global_max": float(np.nanmax(year_max)),
+                            "year_max": year_max}
+
+        # Only the colour-scale extremes are computed (and cached); percentiles would need every pixel at once.
+        key = grid_cache.cache_key("windowed", self.key(name), self.spec(name).nodata_rule.__name__)
+        _, stats = grid_cache.shared_arrays(f"windowed_{name}", key, build_entry)
+        return MaskedLayer(name=name, array=stack, stats=LayerStats(
+            global_min=stats["global_min"], global_max=stats["global_max"], year_max=tuple(stats["year_max"]), percentiles=MappingProxyType({})))
+
+    def summed_area(self, name: str) -> SummedArea:
+        if name in WINDOWED_DATASETS:
+            # The tables hold three times the bytes of the stack itself, so they cannot be built for
+            # a dataset that is read windowed because it does not fit in memory.
+            raise ValueError(f"Dataset {name} is read windowed and has no summed-area tables; "
+                             f"remove it from WINDOWED_DATASETS to aggregate it")
+        masked = self.masked(name)
+        key = self.key(name)
+        return self._values.get(("summed_area", name, key), lambda: cached_summed_area(
+            name, key, lambda: np.asarray(masked.array)))
+
+    def overviews(self, name: str) -> Tuple[Overview, ...]:
+        """
+        Decimated levels of the stack a dataset is rendered from: the masked stack averaged, or the
+        categorical stack by majority class.
+        """
+        key = self.key(name)
+        if self.spec(name).nodata_rule is None:
+            datastruct = self.datastruct(name)
+            return self._values.get(("overviews", name, key), lambda: cached_overviews(
+                name, key, lambda: datastruct.array, categorical=True, nodata=datastruct.nodata))
+        masked = self.masked(name)
+        return self._values.get(("overviews", name, key), lambda: cached_overviews(
+            name, key, lambda: masked.array))
+
+    def is_loaded(self, name: str) -> bool:
+        key = self.state().keys.get(name)
+        return key is not None and (("datastruct", name, key) in self._values or ("compact", name, key) in self._values)
+
+    def _warm_up(self, name: str) -> float:
+        start = time.perf_counter()
+        if name in WINDOWED_DATASETS:
+            # Read on demand; only the colour-scale statistics are worth preparing.
+            self.masked(name)
+        else:
+            self.datastruct(name)
+            if self.spec(name).nodata_rule is not None:
+                self.masked(name)
+                self.summed_area(name)
+            self.overviews(name)
+        return time.perf_counter() - start
+
+    def warm_up(self, names=None) -> Dict[str, float]:
+        """
+        Load the datasets (all by default) in parallel; returns and prints the seconds each took.
+        A dataset masked with another one waits for it, so mask sources are not loaded twice.
+        """
+        names = list(names or self.names())
+        # Each dataset runs in a copy of the caller's context, so a pinned state carries over to the threads.
+        contexts = [copy_context() for _ in names]
+        with ThreadPoolExecutor(max_workers=max(1, min(INGEST_THREADS, len(names))),
+                                thread_name_prefix="warm-up") as executor:
+            timings = dict(zip(names, executor.map(lambda context, name: context.run(self._warm_up, name),
+                                                   contexts, names)))
+        for name, seconds in timings.items():
+            print(f"{name}: ready in {seconds:.2f}s")
+        return timings
+
+    def reload(self, names=None) -> List[str]:
+        """
+        Re-ingest the datasets in use whose source folders changed (among those built from the folders
+        of names, all by default) and publish them as the next generation. Returns the reloaded names.
+
+        The new stacks, their derived products and the reload hooks' grids are all built (and
+        validated) with the new state pinned, while requests keep being served from the current one;
+        the swap itself is a single assignment. If anything fails nothing is published.
+        """
+        with self._reload_lock:
+            current = self._state
+            folders = None if names is None else {self.spec(name).path for name in names}
+            candidates = [name for name in list(current.keys)
+                          if folders is None or folders.intersection(self.dataset_paths(name))]
+            fresh = {name: dataset_cache_key(name, *self.dataset_paths(name)) for name in candidates}
+            changed = [name for name in candidates if fresh[name] != current.keys[name]]
+            if not changed:
+                return []
+
+            pending = RegistryState(generation=current.generation + 1,
+                                    keys={**current.keys, **{name: fresh[name] for name in changed}}, derived={})
+            try:
+                with self.pinned(pending):
+                    self.warm_up(changed)
+                    for hook in self._reload_hooks:
+                        hook(current)
+                self._previous, self._state = current, pending
+                print(f"generation {pending.generation}: reloaded {', '.join(changed)}")
+            finally:
+                # Keep what the two latest states use: requests pinned to the previous one may still need it.
+                live = set(self._state.keys.values()) | set(self._previous.keys.values())
+                self._values.retain(lambda key: key[-1] in live)
+            return changed
+
+    def _build(self, name: str) -> DataStruct:
+        spec = self.spec(name)
+        start = time.perf_counter()
+        raster_layers = spec.read(spec.path)
+        read_seconds = time.perf_counter() - start
+        if spec.resampling is not None:
+            raster_layers = convert_all_raster_layers_to_common_grid(raster_layers, spec.resampling)
+        if not check_important_meta_consistency(raster_layers):
+            raise ValueError(f"Dataset {name}: the files in {spec.path} are not on one grid")
+        datastruct = spec.stack(raster_layers)
+        if datastruct.array.shape[-2:] != (common_grid["height"], common_grid["width"]):
+            raise ValueError(f"Dataset {name}: stack of shape {datastruct.array.shape} is not on the common grid")
+        if spec.mask_with is not None:
+            mask_source = self.datastruct(spec.mask_with)
+            datastruct.array[np.asarray(mask_source.array) == mask_source.nodata] = datastruct.nodata
+        print(f"{name}: read {len(raster_layers)} files in {read_seconds:.2f}s, "
+              f"built in {time.perf_counter() - start:.2f}s")
+        return datastruct
+
+
+DATASET_ROOT = "./python_app/datasets"
+# Datasets whose masked stack is read from the GeoTIFFs window by window (see window_reader) instead of held in memory.
+# Overviews and zonal statistics read them one year at a time; /aggregate rejects them, since their
+# summed-area tables would be larger than the stack.
+WINDOWED_DATASETS = frozenset(filter(None, os.environ.get("WINDOWED_DATASETS", "").split(",")))
+# Datasets held as integer codes decoded window by window (see compact): lossless for modis_land and
+# modis_gpp, within half a quantisation step for the others.
+COMPACT_DATASETS = frozenset(filter(None, os.environ.get("COMPACT_DATASETS", "").split(",")))
+
+layer_registry = LayerRegistry({
+    "modis_land": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "Modis_Land_Cover_Data"),
+        stack=convert_modis_land_cover,
+        nodata_rule=None,
+    ),
+    "modis_gpp": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "MODIS_Gross_Primary_Production_GPP"),
+        read=load_and_convert_raster_dataset_as_f32,
+        nodata_rule=gpp_fill_values,
+    ),
+    "climate_precipitation": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "Climate_Precipitation_Data"),
+        resampling=Resampling.cubic,
+    ),
+    "population_density": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "Gridded_Population_Density_Data"),
+        resampling=Resampling.cubic,
+        stack=convert_standard_set_with_interpolation,
+    ),
+    "glw_sheep": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "GLW_Sheep"),
+        resampling=Resampling.cubic,
+        stack=convert_standard_set_with_interpolation,
+        mask_with="modis_land",
+    ),
+    "glw_goat": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "GLW_Goats"),
+        resampling=Resampling.cubic,
+        stack=convert_standard_set_with_interpolation,
+    ),
+    "glw_cattle": DatasetSpec(
+        path=os.path.join(DATASET_ROOT, "GLW_Cattle"),
+        resampling=Resampling.cubic,
+        stack=convert_standard_set_with_interpolation,
+    ),
+})
+
+# Former module-level stacks, still reachable as attributes (e.g. data_loader.modis_gpp_datastruct)
+# but now loaded on first access.
+_LEGACY_DATASTRUCTS = {
+    "modis_land_raster_datastruct": "modis_land",
+    "modis_gpp_datastruct": "modis_gpp",
+    "climate_precipitation_datastruct": "climate_precipitation",
+    "population_density_datastruct": "population_density",
+    "glw_sheep_datastruct": "glw_sheep",
+    "glw_goat_datastruct": "glw_goat",
+    "glw_cattle_datastruct": "glw_cattle",
+}
+
+
+def __getattr__(name: str):
+    if name in _LEGACY_DATASTRUCTS:
+        return layer_registry.datastruct(_LEGACY_DATASTRUCTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
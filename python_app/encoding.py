@@ -0,0 +1,128 @@
+"""
+Binary encoding of cutout values for the /data and /animation endpoints.
+
+Arrays travel as raw little-endian bytes in C order, last axis fastest. Everything a client needs
+to rebuild them (shape, dtype, affine transform, nodata, quantisation scale/offset) is sent in
+X-* response headers, so a browser can wrap the body in a Float32Array/Uint8Array directly.
+"""
+import zlib
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from python_app.warp import fill_value
+
+# Rows per streamed chunk are chosen so each chunk is roughly this many bytes.
+CHUNK_BYTES = 256 * 1024
+QUANTISED_DTYPES = {"uint8": np.uint8, "uint16": np.uint16}
+
+
+class EncodedArray(NamedTuple):
+    array: np.ndarray
+    nodata: float
+    scale: Optional[float] = None
+    offset: Optional[float] = None
+
+
+def encode_values(array: np.ndarray, encoding: str = "raw") -> EncodedArray:
+    """
+    Return the array as little-endian raw values, or linearly quantised to uint8/uint16.
+
+    Quantised values decode as value = q * scale + offset; the type's maximum marks nodata.
+    """
+    if encoding == "raw":
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        return EncodedArray(array, fill_value(array.dtype))
+    if encoding not in QUANTISED_DTYPES:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    if array.dtype.kind != 'f':
+        raise ValueError(f"Only floating point layers can be quantised, not {array.dtype.name}")
+
+    dtype = np.dtype(QUANTISED_DTYPES[encoding]).newbyteorder("<")
+    nodata = np.iinfo(dtype).max
+    valid = np.isfinite(array)
+    if valid.any():
+        offset = float(array[valid].min())
+        span = float(array[valid].max()) - offset
+    else:
+        offset, span = 0.0, 0.0
+    scale = span / (nodata - 1) if span > 0 else 1.0
+
+    quantised = np.full(array.shape, nodata, dtype=dtype)
+    quantised[valid] = np.rint((array[valid] - offset) / scale)
+    return EncodedArray(quantised, nodata, scale, offset)
+
+
+def array_headers(encoded: EncodedArray, transform=None, **extra) -> Dict[str, str]:
+    array = encoded.array
+    nodata = encoded.nodata
+    headers = {
+        "X-Shape": ",".join(str(n) for n in array.shape),
+        "X-Dtype": array.dtype.name,
+        "X-Nodata": "nan" if np.isnan(nodata) else str(nodata),
+    }
+    if transform is not None:
+        headers["X-Transform"] = ",".join(repr(v) for v in transform[:6])
+    if encoded.scale is not None:
+        headers["X-Scale"] = repr(encoded.scale)
+        headers["X-Offset"] = repr(encoded.offset)
+    headers.update(extra)
+    return headers
+
+
+def _compressor(compression: str):
+    if compression == "deflate":
+        return zlib.compressobj(6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression needs the optional zstandard package")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def iter_chunks(array: np.ndarray, compression: str = "none", chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Yield the raw bytes of an array in slices along its first axis, compressed on the fly,
+    so large cutouts are streamed instead of built as one response body.
+    """
+    # Built up front so an unusable compression fails before any part of the response is sent.
+    compressor = None if compression == "none" else _compressor(compression)
+    row_bytes = max(array[:1].nbytes, 1)
+    step = max(1, chunk_bytes // row_bytes)
+
+    def chunks():
+        for start in range(0, len(array), step):
+            chunk = array[start:start + step].tobytes()
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    return chunks()
+
+
+def parse_byte_range(range_header: str, size: int):
+    """
+    Parse a single "bytes=start-end" (or "bytes=-suffix") range into a half-open (start, stop).
+    Returns None for headers this server does not handle (they get the full body) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            stop = min(int(last) + 1, size) if last else size
+        else:
+            start, stop = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    if start >= size or start >= stop:
+        raise ValueError(f"Range {range_header} not satisfiable for {size} bytes")
+    return start, stop
@@ -0,0 +1,195 @@
+"""
+Versioned on-disk cache of arrays that have been brought onto the common grid.
+
+Each entry is a directory holding one .npy file per array plus a meta.json, named after
+the cached object and a hash of everything it was derived from (source file fingerprints,
+the common grid definition, CACHE_VERSION). Entries are opened with
+np.load(mmap_mode='r'), so a warm start maps the stacks instead of reading and
+reprojecting the GeoTIFFs again.
+
+The same files are how several API worker processes share one copy of the data: the first
+worker to need an entry builds and publishes it under an exclusive file lock, every other
+worker maps the published files read-only, and the OS page cache backs all mappings with
+the same physical memory.
+
+A process holds a shared lock on every entry it has mapped for as long as any of the mapped
+arrays is alive. Publishing a new entry only removes the older entries of the same name that
+no process holds any more, so during a rolling reload the workers still serving the previous
+generation keep its entry instead of rebuilding it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+import numpy as np
+
+CACHE_VERSION = 3
+GRID_CACHE_DIR = os.environ.get("GRID_CACHE_DIR", "./python_app/.grid_cache")
+
+
+def folder_fingerprint(folder: str) -> str:
+    """
+    Hash of the relative path, size and modification time of every file below folder.
+    """
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, folder)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    digest = hashlib.sha1(f"v{CACHE_VERSION};".encode())
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b";")
+    return digest.hexdigest()
+
+
+def _entry_dir(name: str, key: str) -> str:
+    return os.path.join(GRID_CACHE_DIR, f"{name}-{key[:16]}")
+
+
+class _EntryHold:
+    """
+    Shared lock on an entry's meta.json, released once every array mapped from the entry is gone.
+    """
+
+    def __init__(self, f):
+        self._finalizer = weakref.finalize(self, f.close)
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH)
+
+
+def load(name: str, key: str) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """
+    Return the memory-mapped, read-only arrays and the metadata of an entry, or None on a miss.
+    """
+    entry = _entry_dir(name, key)
+    try:
+        f = open(os.path.join(entry, "meta.json"))
+    except OSError:
+        return None
+    try:
+        hold = _EntryHold(f)
+        meta = json.load(f)
+        if meta.get("key") != key:
+            return None
+        arrays = {array_name: np.load(os.path.join(entry, f"{array_name}.npy"), mmap_mode="r")
+                  for array_name in meta["arrays"]}
+    except (OSError, ValueError, KeyError):
+        f.close()
+        return None
+    for array in arrays.values():
+        array.cache_hold = hold
+    return arrays, meta["meta"]
+
+
+def _prune(name: str, keep: str):
+    """
+    Remove the entries of a name other than keep that no process holds.
+    Without fcntl there is no way to tell, so nothing is removed.
+    """
+    if fcntl is None:
+        return
+    for other in os.listdir(GRID_CACHE_DIR):
+        other_path = os.path.join(GRID_CACHE_DIR, other)
+        if not other.startswith(f"{name}-") or other_path == keep or ".tmp-" in other or other.endswith(".lock"):
+            continue
+        try:
+            with open(os.path.join(other_path, "meta.json")) as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(other_path, ignore_errors=True)
+        except OSError:
+            # Still mapped by some process (or already gone).
+            continue
+
+
+def store(name: str, key: str, arrays: Dict[str, np.ndarray], meta: dict) -> bool:
+    """
+    Write an entry atomically and drop the older entries of the same name that no process holds.
+    Returns False (and leaves the cache untouched) if the cache directory is not writable.
+    """
+    entry = _entry_dir(name, key)
+    tmp_entry = f"{entry}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(tmp_entry, exist_ok=True)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_entry, f"{array_name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+            json.dump({"key": key, "arrays": list(arrays), "meta": meta}, f)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another worker published the same entry first.
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+    except OSError as e:
+        print(f"Could not write grid cache entry {entry}: {e}")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return False
+
+    _prune(name, entry)
+    return True
+
+
+@contextmanager
+def build_lock(name: str):
+    """
+    Hold an exclusive cross-process lock while an entry is being built.
+    Without a writable cache directory (or fcntl) every process simply builds its own copy.
+    """
+    try:
+        os.makedirs(GRID_CACHE_DIR, exist_ok=True)
+        lock_file = open(os.path.join(GRID_CACHE_DIR, f"{name}.lock"), "w")
+    except OSError:
+        yield
+        return
+    with lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def shared_arrays(name: str, key: str, build: Callable[[], Tuple[Dict[str, np.ndarray], dict]]
+                  ) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Attach to the published entry, or build and publish it once across all processes.
+    Returns read-only memory-mapped arrays whenever the cache is usable.
+    """
+    entry = load(name, key)
+    if entry is not None:
+        return entry
+    with build_lock(name):
+        # Another process may have published the entry while we waited for the lock.
+        entry = load(name, key)
+        if entry is not None:
+            return entry
+        arrays, meta = build()
+        stored = store(name, key, arrays, meta)
+    # The published entry can still fail to open (pruned, or lost to a failed rename): serve what was built.
+    entry = load(name, key) if stored else None
+    if entry is not None:
+        return entry
+    for array in arrays.values():
+        array.flags.writeable = False
+    return arrays, meta
+
+
+def shared_array(name: str, key: str, build: Callable[[], np.ndarray]) -> np.ndarray:
+    arrays, _ = shared_arrays(name, key, lambda: ({"array": build()}, {}))
+    return arrays["array"]
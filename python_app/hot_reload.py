@@ -0,0 +1,102 @@
+"""
+Hot reload of dataset folders without restarting the workers.
+
+layer_registry.reload() re-ingests the datasets whose folders changed and publishes them as the
+next generation; a DatasetReloader runs it in the background, on demand (POST /admin/reload, enabled
+by setting ADMIN_TOKEN) or from a watcher thread that polls the dataset folders every
+RELOAD_POLL_SECONDS.
+
+Every worker process holds its own registry, so each one has to reload itself. With several
+workers, enable the watcher in all of them: the rebuilt stacks go through the shared grid cache,
+so only the first worker to reach a changed dataset ingests it and the others attach its arrays.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from python_app import grid_cache
+from python_app.data_loader import LayerRegistry, layer_registry
+
+# Seconds between two scans of the dataset folders; 0 disables the watcher.
+RELOAD_POLL_SECONDS = float(os.environ.get("RELOAD_POLL_SECONDS", 0))
+
+
+class DatasetReloader:
+    def __init__(self, registry: LayerRegistry = layer_registry):
+        self.registry = registry
+        self.last: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def reload(self, names: Optional[List[str]] = None) -> dict:
+        """
+        Reload now, in the calling thread. A failed reload publishes nothing and is reported, not raised.
+        """
+        start = time.perf_counter()
+        try:
+            outcome = {"reloaded": self.registry.reload(names), "error": None}
+        except Exception as e:
+            print(f"Reload failed, still serving generation {self.registry.generation}: {e}")
+            outcome = {"reloaded": [], "error": f"{type(e).__name__}: {e}"}
+        outcome.update(generation=self.registry.generation, seconds=round(time.perf_counter() - start, 2),
+                       finished_at=time.time())
+        self.last = outcome
+        return outcome
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, names: Optional[List[str]] = None) -> bool:
+        """
+        Reload on a background thread; returns False (and does nothing) if a reload is already running.
+        """
+        with self._lock:
+            if self.running():
+                return False
+            self._thread = threading.Thread(target=self.reload, args=(names,), name="dataset-reload", daemon=True)
+            self._thread.start()
+        return True
+
+    def status(self) -> dict:
+        return {"generation": self.registry.generation, "running": self.running(), "last": self.last}
+
+    def _fingerprints(self) -> Dict[str, str]:
+        return {name: grid_cache.folder_fingerprint(self.registry.spec(name).path) for name in self.registry.names()}
+
+    def _watch(self, poll_seconds: float):
+        handled = seen = self._fingerprints()
+        while not self._stop.wait(poll_seconds):
+            current = self._fingerprints()
+            # Only reload folders that looked the same on two polls in a row, so files still being
+            # copied in are not read half-written.
+            settled = current == seen
+            seen = current
+            if not settled or current == handled:
+                continue
+            changed = [name for name in current if current[name] != handled.get(name)]
+            handled = current
+            print(f"Dataset folders changed: {', '.join(changed)}")
+            self.reload(changed)
+
+    def watch(self, poll_seconds: float = RELOAD_POLL_SECONDS):
+        """
+        Start the watcher thread (once); a no-op when poll_seconds is 0.
+        """
+        if poll_seconds <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(poll_seconds,), name="dataset-watcher",
+                                         daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+dataset_reloader = DatasetReloader()
@@ -0,0 +1,83 @@
+"""
+Read-only [year, rows, columns] stacks whose values are produced window by window.
+
+A LazyStack slices like the in-memory stack it stands in for: integer and slice indexing of years
+stay lazy until rows and columns are selected, selecting them produces just that window, and
+np.asarray() materialises everything for code that needs the full grid. Subclasses hold one
+entry per year and implement _read (a window of some years) and _subset (a stack of some years).
+"""
+from abc import ABC, abstractmethod
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+def _axis_window(index, length: int):
+    """
+    The [start, stop) range to read along one axis for an index, and the index relative to that window.
+    """
+    if isinstance(index, slice):
+        start, stop, step = index.indices(length)
+        if step > 0:
+            return start, max(start, stop), slice(None, None, step)
+    absolute = np.arange(length)[index]
+    if np.size(absolute) == 0:
+        return 0, 0, absolute
+    start = int(np.min(absolute))
+    return start, int(np.max(absolute)) + 1, absolute - start
+
+
+class LazyStack(ABC):
+    def __init__(self, years: Sequence, grid_shape: Tuple[int, int], dtype, squeeze: bool = False):
+        self.years = list(years)
+        self.squeeze = squeeze
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(grid_shape) if squeeze else (len(self.years),) + tuple(grid_shape)
+        self.ndim = len(self.shape)
+        self.size = int(np.prod(self.shape))
+        self.nbytes = self.size * self.dtype.itemsize
+
+    @abstractmethod
+    def _read(self, years: List, row_start: int, row_stop: int, col_start: int, col_stop: int) -> np.ndarray:
+        """
+        The [year, rows, columns] window of the given year entries, as an array of self.dtype.
+        """
+
+    @abstractmethod
+    def _subset(self, years: List, squeeze: bool) -> "LazyStack":
+        """
+        A stack of the given year entries, squeezed to one [rows, columns] grid if squeeze is set.
+        """
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            at = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:at] + (slice(None),) * (self.ndim - len(key) + 1) + key[at + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if self.squeeze:
+            key = (0,) + key
+        years, rows, cols = key
+
+        full = slice(None)
+        if isinstance(rows, slice) and rows == full and isinstance(cols, slice) and cols == full \
+                and isinstance(years, (slice, int, np.integer)):
+            if isinstance(years, slice):
+                return self._subset(self.years[years], squeeze=False)
+            return self._subset([self.years[years]], squeeze=True)
+
+        selected = self.years[years] if isinstance(years, slice) else [self.years[years]]
+        height, width = self.shape[-2:]
+        row_start, row_stop, row_index = _axis_window(rows, height)
+        col_start, col_stop, col_index = _axis_window(cols, width)
+        values = self._read(selected, row_start, row_stop, col_start, col_stop)[:, row_index, col_index]
+        return values if isinstance(years, slice) else values[0]
+
+    def __array__(self, dtype=None, copy=None):
+        height, width = self.shape[-2:]
+        values = self._read(self.years, 0, height, 0, width)
+        values = values[0] if self.squeeze else values
+        return values if dtype is None else values.astype(dtype)
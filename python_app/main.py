@@ -1,149 +1,429 @@
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Optional
+
+import numpy as np
 import uvicorn
-from fastapi.responses import Response
-from fastapi import FastAPI, Query, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from fastapi import FastAPI, Query, HTTPException, Path, Request
+from starlette.concurrency import run_in_threadpool
+
+from python_app.analytics import Analysis, analysis_cache_stats, warm_up
+from python_app.data_loader import layer_registry
+from python_app.hot_reload import dataset_reloader
+from python_app.render_pool import RETRY_AFTER_SECONDS, ClientDisconnected, RenderPool, RenderPoolSaturated
+from python_app.tiles import TILE_CACHE_CONTROL, TileCache, read_pyramid_tile
+from python_app.models import AllowedLayer, AnalyticsInput, AnalyticsKernel, AreaQuery, PointsQuery
+from python_app.points import lonlat_to_pixels, sample, timeseries
+from python_app.aggregate import aggregate
+from python_app.zonal import ZONAL_STATS, ZONE_LAYERS, zonal_statistics
+from python_app.encoding import array_headers, encode_values, iter_chunks, parse_byte_range
+from python_app.visualizer import (cutout_cube, cutout_values, get_layer, layer_analysis, render_analysis, render_animation,
+                                   render_bundle, render_composite, render_cutout, render_tile)
+from python_app.window_reader import block_cache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Datasets load lazily on first use; WARM_UP=1 loads them all before the first request instead.
+    if os.environ.get("WARM_UP", "").lower() in ("1", "true", "yes"):
+        warm_up()
+    # RELOAD_POLL_SECONDS > 0 reloads dataset folders as they change (see hot_reload).
+    dataset_reloader.watch()
+    yield
+    dataset_reloader.stop()
+    render_pool.shutdown()
 
-from python_app.visualizer import visualize_animal_desertifation_cutout,visualize_animal_gpp_change_cutout,visualize_vegetation_change_cutout,visualize_land_cutout, visualize_gpp_cutout, visualize_glw_cattle_cutout , visualize_precipitation_cutout, visualize_glw_goat_cutout ,visualize_glw_sheep_cutout ,visualize_population_density_cutout
 
 app = FastAPI(
     title="Spatial Data API",
-    description="API to query spatial data by bounding box, year, and layer(s)"
+    description="API to query spatial data by bounding box, year, and layer(s)",
+    lifespan=lifespan
 )
 
+tile_cache = TileCache()
+render_pool = RenderPool()
+# The admin endpoints require it in the X-Admin-Token header; they are disabled (404) while it is unset.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+class PinRegistryState:
+    """
+    ASGI middleware serving each request from the registry state current when it arrived, so a
+    reload published meanwhile does not mix old and new data within one response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with layer_registry.pinned():
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(PinRegistryState)
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is listening any more; the status only shows up in the access log.
+    return Response(status_code=499)
+
+
+async def run_render(request: Request, fn, *args, **kwargs):
+    """
+    Run a render function on the bounded render pool, turning saturation into a 503.
+    """
+    try:
+        return await render_pool.run(request, fn, *args, **kwargs)
+    except RenderPoolSaturated:
+        raise HTTPException(status_code=503, detail="Rendering capacity exhausted, retry shortly",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+async def render_png(request: Request, layer: str, *args, **kwargs) -> bytes:
+    """
+    Run render_cutout for a layer on the bounded render pool and return the encoded image.
+    """
+    png_bytes_io = await run_render(request, render_cutout, layer, *args, **kwargs)
+    return png_bytes_io.getvalue()
+
+
+def multipart_bundle(images: Dict[str, bytes], media_type: str = "image/png") -> Response:
+    boundary = secrets.token_hex(16)
+    body = bytearray()
+    for layer, content in images.items():
+        body += (f"--{boundary}\r\n"
+                 f"Content-Type: {media_type}\r\n"
+                 f'Content-Disposition: inline; name="{layer}"; filename="{layer}.png"\r\n'
+                 f"Content-Length: {len(content)}\r\n\r\n").encode()
+        body += content
+        body += b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return Response(content=bytes(body), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+def check_finite(**coordinates):
+    """
+    Reject NaN and infinite coordinates (accepted by float query parameters) with a 400.
+    """
+    for name, value in coordinates.items():
+        if not np.all(np.isfinite(value)):
+            raise HTTPException(status_code=400, detail=f"{name} must be a finite number")
+
 
 @app.get("/", tags=["Root"])
 def root():
     return {"message": "Spatial Data API is running"}
 
 
-@app.get("/cutout/land", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+@app.get("/cutout/{layer}", response_class=Response)
+async def get_cutout(request: Request, layer: AllowedLayer, lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023"),
+                     year_from: Optional[int] = Query(None, ge=2010, le=2023, description="Analytics layers only: first year of the period"),
+                     year_to: Optional[int] = Query(None, ge=2010, le=2023, description="Analytics layers only: last year of the period"),
+                     kernel: Optional[AnalyticsKernel] = Query(None, description="Analytics layers only: smoothing kernel")):
     """
     Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    GET /cutout/land?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Analytics layers (vegetation_change, animal_gpp, animal_desertification) ignore year and cover
+    their default period unless year_from / year_to / kernel are given, e.g.:
+    GET /cutout/animal_gpp?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2020&year_from=2012&year_to=2020
     """
+    check_finite(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2)
     try:
-        png_bytes_io = visualize_land_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        if year_from is None and year_to is None and kernel is None:
+            png_bytes = await render_png(request, layer, lon1, lat1, lon2, lat2, year=year-2010)
+        else:
+            analysis = layer_analysis(layer, None if year_from is None else year_from - 2010,
+                                      None if year_to is None else year_to - 2010, kernel)
+            png_bytes_io = await run_render(request, render_analysis, analysis, get_layer(layer).cmap,
+                                            lon1, lat1, lon2, lat2)
+            png_bytes = png_bytes_io.getvalue()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return Response(content=png_bytes, media_type="image/png")
 
-@app.get("/cutout/gpp", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+
+@app.get("/analytics/stats", tags=["Analytics"])
+def get_analysis_cache_stats():
+    return analysis_cache_stats()
+
+
+@app.get("/analytics/{kind}", response_class=Response, tags=["Analytics"])
+async def get_analytics(request: Request, kind: Literal["change", "correlation"], lon1: float, lat1: float,
+                        lon2: float, lat2: float, layer_a: AnalyticsInput,
+                        layer_b: Optional[AnalyticsInput] = Query(None, description="Second input of a correlation"),
+                        year_from: int = Query(..., ge=2010, le=2023), year_to: int = Query(..., ge=2010, le=2023),
+                        kernel: AnalyticsKernel = Query("normalized", description="Smoothing kernel of layer_a"),
+                        mask: Optional[Literal["above", "below", "outside"]] = Query(None, description="Keep only values above/below threshold, or outside +-threshold"),
+                        threshold: float = 0.0,
+                        width: int = Query(854, ge=1, le=4096), height: int = Query(480, ge=1, le=4096)):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Render a change or correlation analysis for any pair of years, computed on demand and memoised, e.g.:
+    GET /analytics/correlation?layer_a=gpp&layer_b=livestock&year_from=2012&year_to=2018&kernel=wide&lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229
     """
+    check_finite(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2)
+    if kind == "correlation" and layer_b is None:
+        raise HTTPException(status_code=400, detail="A correlation needs layer_b")
+    analysis = Analysis(kind, layer_a, layer_b if kind == "correlation" else None, year_from - 2010,
+                        year_to - 2010, kernel, mask, threshold)
+    cmap = "RdGy" if kind == "correlation" else "plasma"
     try:
-        png_bytes_io = visualize_gpp_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        png_bytes_io = await run_render(request, render_analysis, analysis, cmap, lon1, lat1, lon2, lat2,
+                                        dst_width=width, dst_height=height)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    return Response(content=png_bytes_io.getvalue(), media_type="image/png")
+
 
-@app.get("/cutout/population", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+@app.post("/composite", response_class=Response)
+async def post_composite(request: Request, query: AreaQuery,
+                         mode: Literal["composite", "multipart"] = Query("composite", description="One alpha-composited image, or one image per layer as multipart/mixed"),
+                         width: int = Query(854, ge=1, le=4096), height: int = Query(480, ge=1, le=4096)):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Render several layers of one bounding box in a single request. The area is warped once for
+    all layers; in composite mode the layers are stacked in the order given, first at the bottom.
+    Example body:
+    {"year": 2015, "min_lat": 16.42, "max_lat": 16.98, "min_lon": -12.31, "max_lon": -11.28, "layers": ["land", "goat"]}
     """
+    check_finite(min_lat=query.min_lat, max_lat=query.max_lat, min_lon=query.min_lon, max_lon=query.max_lon)
+    if not query.layers:
+        raise HTTPException(status_code=400, detail="At least one layer is required")
+    area = (query.layers, query.min_lon, query.max_lat, query.max_lon, query.min_lat)
     try:
-        png_bytes_io = visualize_population_density_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        if mode == "composite":
+            png_bytes_io = await run_render(request, render_composite, *area, year=query.year - 2010,
+                                            dst_width=width, dst_height=height)
+            return Response(content=png_bytes_io.getvalue(), media_type="image/png")
+        images = await run_render(request, render_bundle, *area, year=query.year - 2010,
+                                  dst_width=width, dst_height=height)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    return multipart_bundle(images)
+
 
-@app.get("/cutout/precipitation", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+@app.get("/data/{layer}", response_class=Response)
+async def get_data(request: Request, layer: AllowedLayer, lon1: float, lat1: float, lon2: float, lat2: float,
+                   year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023"),
+                   width: Optional[int] = Query(None, ge=1, le=4096, description="Defaults to the grid resolution, or follows height at the aspect ratio of the area"),
+                   height: Optional[int] = Query(None, ge=1, le=4096, description="Defaults to the grid resolution, or follows width at the aspect ratio of the area"),
+                   encoding: Literal["raw", "uint8", "uint16"] = Query("raw", description="Raw values, or linearly quantised with X-Scale/X-Offset"),
+                   compression: Literal["none", "deflate", "zstd"] = Query("none", description="Content-Encoding of the body")):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    The cutout values of one layer as a little-endian binary array, e.g.:
+    GET /data/gpp?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Shape, dtype, transform and nodata come in X-* headers (see python_app.encoding). The body
+    is streamed in row chunks; uncompressed bodies also honour single byte Range requests.
     """
+    check_finite(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2)
     try:
-        png_bytes_io = visualize_precipitation_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        array, transform = await run_render(request, cutout_values, layer, lon1, lat1, lon2, lat2,
+                                            year=year - 2010, dst_width=width, dst_height=height)
+        encoded = encode_values(array, encoding)
+        headers = array_headers(encoded, transform)
+        if compression != "none":
+            chunks = iter_chunks(encoded.array, compression)
+            headers["Content-Encoding"] = compression
+            return StreamingResponse(chunks, media_type="application/octet-stream", headers=headers)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
 
-@app.get("/cutout/goat", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
-    """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
-    """
+    body = encoded.array.reshape(-1).view(np.uint8)
+    headers["Accept-Ranges"] = "bytes"
     try:
-        png_bytes_io = visualize_glw_goat_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        byte_range = parse_byte_range(request.headers["range"], body.size) if "range" in request.headers else None
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{body.size}"})
+
+    status_code = 200
+    if byte_range is not None:
+        start, stop = byte_range
+        body = body[start:stop]
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{encoded.array.nbytes}"
+        status_code = 206
+    headers["Content-Length"] = str(body.size)
+    return StreamingResponse(iter_chunks(body), status_code=status_code,
+                             media_type="application/octet-stream", headers=headers)
 
-@app.get("/cutout/cattle", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+
+@app.get("/animation/{layer}", response_class=Response)
+async def get_animation(request: Request, layer: AllowedLayer, lon1: float, lat1: float, lon2: float, lat2: float,
+                        start_year: int = Query(2010, ge=2010, le=2023), end_year: int = Query(2023, ge=2010, le=2023),
+                        format: Literal["apng", "webp", "cube"] = Query("apng", description="Animated PNG, animated WebP or the raw data cube"),
+                        width: int = Query(854, ge=1, le=4096), height: int = Query(480, ge=1, le=4096),
+                        duration: int = Query(500, ge=20, le=10000, description="Frame duration in milliseconds")):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Every year of a layer for one area, warped in a single pass, e.g.:
+    GET /animation/gpp?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&start_year=2010&end_year=2023
+    The cube format returns the raw [year, rows, columns] values, described like /data responses.
     """
+    check_finite(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2)
+    if start_year > end_year:
+        raise HTTPException(status_code=400, detail="start_year must not be after end_year")
+    years = slice(start_year - 2010, end_year - 2010 + 1)
+    area = (layer, lon1, lat1, lon2, lat2, years)
     try:
-        png_bytes_io = visualize_glw_cattle_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        if format == "cube":
+            cube, transform, _ = await run_render(request, cutout_cube, *area, dst_width=width, dst_height=height)
+            encoded = encode_values(cube)
+            headers = array_headers(encoded, transform, **{"X-Years": f"{start_year}-{end_year}"})
+            return Response(content=encoded.array.tobytes(), media_type="application/octet-stream", headers=headers)
+        image_format = "png" if format == "apng" else "webp"
+        image_bytes_io = await run_render(request, render_animation, *area, dst_width=width, dst_height=height,
+                                          image_format=image_format, duration_ms=duration)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    media_type = "image/apng" if format == "apng" else "image/webp"
+    return Response(content=image_bytes_io.getvalue(), media_type=media_type)
 
-@app.get("/cutout/sheep", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+
+@app.get("/point", tags=["Values"])
+def get_point(lon: float, lat: float, layers: List[AllowedLayer] = Query(...),
+              year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Values of one or more layers at a coordinate, e.g.:
+    GET /point?lon=-11.8&lat=16.7&layers=gpp&layers=goat&year=2015
+    Values are null outside the grid and on nodata pixels.
+    """
+    check_finite(lon=lon, lat=lat)
+    pixels = rows, cols, inside = lonlat_to_pixels(lon, lat)
+    pixel = {"row": int(rows[0]), "col": int(cols[0])} if inside[0] else {"row": None, "col": None}
+    values = {layer: sample(layer, pixels, year - 2010)[0] for layer in dict.fromkeys(layers)}
+    return {"lon": lon, "lat": lat, "year": year, **pixel, "values": values}
+
+
+@app.get("/timeseries", tags=["Values"])
+def get_timeseries(lon: float, lat: float, layer: AllowedLayer):
     """
+    The value of a layer at a coordinate for every year, e.g.:
+    GET /timeseries?lon=-11.8&lat=16.7&layer=gpp
+    """
+    check_finite(lon=lon, lat=lat)
     try:
-        png_bytes_io = visualize_glw_sheep_cutout(lon1, lat1, lon2, lat2, year=year-2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        values = timeseries(layer, lon, lat)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    return {"lon": lon, "lat": lat, "layer": layer, "years": list(range(2010, 2010 + len(values))), "values": values}
+
 
-@app.get("/cutout/vegetation_change", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+@app.post("/points", tags=["Values"])
+def post_points(query: PointsQuery):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Values of several layers at many coordinates in one call; each layer maps to a list in point order.
+    """
+    check_finite(lon=query.lon, lat=query.lat)
+    if len(query.lon) != len(query.lat):
+        raise HTTPException(status_code=400, detail="lon and lat must have the same length")
+    pixels = lonlat_to_pixels(query.lon, query.lat)
+    values = {layer: sample(layer, pixels, query.year - 2010) for layer in dict.fromkeys(query.layers)}
+    return {"year": query.year, "values": values}
+
+
+@app.get("/zonal/{layer}", tags=["Values"])
+async def get_zonal(request: Request, layer: AllowedLayer,
+                    zones: Literal[tuple(ZONE_LAYERS)] = Query("districts", description="Admin_layers polygons to aggregate over"),
+                    stats: List[Literal[ZONAL_STATS]] = Query(list(ZONAL_STATS), description="Statistics to return")):
+    """
+    Per-zone statistics of a layer for every year, e.g.:
+    GET /zonal/gpp?zones=districts&stats=mean&stats=p50
     """
     try:
-        png_bytes_io = visualize_vegetation_change_cutout(lon1, lat1, lon2, lat2, year=year - 2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        return await run_render(request, zonal_statistics, layer, zones, tuple(dict.fromkeys(stats)))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
 
-@app.get("/cutout/animal_gpp", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+
+@app.get("/aggregate", tags=["Values"])
+async def get_aggregate(request: Request, lon1: float, lat1: float, lon2: float, lat2: float,
+                        layers: List[AllowedLayer] = Query(...),
+                        year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Sum, mean and valid pixel count of each layer inside a bounding box, in constant time, e.g.:
+    GET /aggregate?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&layers=goat&layers=gpp&year=2015
+    Pixels cut by the box edges count with the covered fraction.
     """
+    check_finite(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2)
+    def compute():
+        return {layer: aggregate(layer, lon1, lat1, lon2, lat2, year - 2010) for layer in dict.fromkeys(layers)}
+
     try:
-        png_bytes_io = visualize_animal_gpp_change_cutout(lon1, lat1, lon2, lat2, year=year - 2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        results = await run_render(request, compute)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    return {"year": year, "results": results}
+
+
+@app.get("/tiles/stats", tags=["Tiles"])
+def get_tile_cache_stats():
+    return tile_cache.stats()
+
+
+@app.get("/render/stats", tags=["Tiles"])
+def get_render_pool_stats():
+    return render_pool.stats()
+
+
+@app.get("/blocks/stats", tags=["Tiles"])
+def get_block_cache_stats():
+    return block_cache.stats()
+
+
+def check_admin_token(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 
-@app.get("/cutout/animal_desertification", response_class=Response)
-def get_cutout(lon1: float, lat1: float, lon2: float, lat2: float,year: int = Query(..., ge=2010, le=2023, description="Year between 2010 and 2023")):
+@app.post("/admin/reload", status_code=202, tags=["Admin"])
+def post_reload(request: Request, datasets: Optional[List[str]] = Query(
+        None, description="Dataset folders to check (all by default); datasets masked with them are included")):
     """
-    Example endpoint:
-    GET /cutout?lon1=-11.2843&lat1=16.9779&lon2=-12.3143&lat2=16.4229&year=2010
+    Re-ingest the changed dataset folders in the background; GET /admin/reload reports the outcome.
     """
+    check_admin_token(request)
     try:
-        png_bytes_io = visualize_animal_desertifation_cutout(lon1, lat1, lon2, lat2, year=year - 2010)  # update your function to handle year
-        png_bytes = png_bytes_io.getvalue()
+        for name in datasets or ():
+            layer_registry.spec(name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return Response(content=png_bytes, media_type="image/png")
+    if not dataset_reloader.start(datasets):
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    return dataset_reloader.status()
+
+
+@app.get("/admin/reload", tags=["Admin"])
+def get_reload_status(request: Request):
+    check_admin_token(request)
+    return dataset_reloader.status()
+
+
+@app.get("/tiles/{layer}/{year}/{z}/{x}/{y}.png", response_class=Response, tags=["Tiles"])
+async def get_tile(request: Request, layer: AllowedLayer, year: int = Path(..., ge=2010, le=2023), z: int = Path(..., ge=0, le=22),
+             x: int = Path(..., ge=0), y: int = Path(..., ge=0)):
+    """
+    XYZ tile endpoint for Leaflet tile layers, e.g.:
+    GET /tiles/gpp/2015/10/477/456.png
+    """
+    # A reload starts a new generation, so tiles rendered from replaced data are never served again.
+    key = (layer_registry.generation, layer, year, z, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        png_bytes = await run_in_threadpool(read_pyramid_tile, layer, year, z, x, y)
+        if png_bytes is None:
+            try:
+                png_bytes = (await run_render(request, render_tile, layer, z, x, y, year=year - 2010)).getvalue()
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        tile = tile_cache.put(key, png_bytes)
+
+    headers = {"ETag": tile.etag, "Cache-Control": TILE_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == tile.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile.content, media_type="image/png", headers=headers)
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
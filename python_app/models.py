@@ -1,18 +1,29 @@
 from pydantic import BaseModel, Field
 from typing import List, Literal, Union
 
-# Define allowed layer names
-AllowedLayer = Literal["Layer1", "Layer2", "Layer3", "Layer4", "Analytics1", "Analytics2", "Analytics3"]
+# Define allowed layer names (one entry per python_app.visualizer.LAYERS row)
+AllowedLayer = Literal["land", "gpp", "population", "precipitation", "goat", "cattle", "sheep",
+                       "vegetation_change", "animal_gpp", "animal_desertification"]
+# Inputs and smoothing kernels of the analytics engine (python_app.analytics.ANALYTICS_INPUTS / KERNELS)
+AnalyticsInput = Literal["land", "gpp", "livestock", "population", "precipitation"]
+AnalyticsKernel = Literal["normalized", "wide"]
 
 
 class AreaQuery(BaseModel):
-    year: int = Field(..., description="Year of the dataset")
+    year: int = Field(..., ge=2010, le=2023, description="Year of the dataset (2010-2023)")
     min_lat: float = Field(..., description="Minimum latitude of the bounding box")
     max_lat: float = Field(..., description="Maximum latitude of the bounding box")
     min_lon: float = Field(..., description="Minimum longitude of the bounding box")
     max_lon: float = Field(..., description="Maximum longitude of the bounding box")
     layers: List[AllowedLayer] = Field(...,
-                                       description="List of layers to query. Allowed values: Layer1, Layer2, Layer3, Layer4, Analytics1, Analytics2, Analytics3")
+                                       description="List of layers to query. Allowed values: land, gpp, population, precipitation, goat, cattle, sheep, vegetation_change, animal_gpp, animal_desertification")
+
+
+class PointsQuery(BaseModel):
+    year: int = Field(..., ge=2010, le=2023, description="Year of the dataset (2010-2023)")
+    layers: List[AllowedLayer] = Field(..., description="Layers to sample at every point")
+    lon: List[float] = Field(..., max_length=100000, description="Longitudes of the points")
+    lat: List[float] = Field(..., max_length=100000, description="Latitudes of the points, same length as lon")
 
 
 class PixelData(BaseModel):
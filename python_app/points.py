@@ -0,0 +1,71 @@
+"""
+Value lookups at WGS84 coordinates, straight from the [year, rows, columns] stacks.
+
+Coordinates are projected to the grid CRS with the cached transformer and mapped to pixels
+with the inverted grid transform; everything is vectorised, so one call handles one point
+or many thousands at the same per-point cost.
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from affine import Affine
+
+from python_app.data_loader import common_grid
+from python_app.visualizer import get_layer, layer_source, layer_stack
+from python_app.warp import lonlat_transformer
+
+
+@lru_cache(maxsize=1)
+def grid_inverse() -> Affine:
+    return ~common_grid["transform"]
+
+
+def lonlat_to_pixels(lon, lat) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return (rows, cols, inside) for arrays of WGS84 coordinates; rows/cols of points outside
+    the grid are clipped to it and must be masked with inside.
+    """
+    lon = np.atleast_1d(np.asarray(lon, dtype=float))
+    lat = np.atleast_1d(np.asarray(lat, dtype=float))
+    x, y = lonlat_transformer(common_grid["crs"]).transform(lon, lat)
+    inverse = grid_inverse()
+    cols = np.floor(inverse.a * x + inverse.b * y + inverse.c)
+    rows = np.floor(inverse.d * x + inverse.e * y + inverse.f)
+    inside = (np.isfinite(rows) & np.isfinite(cols) & (rows >= 0) & (rows < common_grid["height"])
+              & (cols >= 0) & (cols < common_grid["width"]))
+    rows = np.clip(np.nan_to_num(rows), 0, common_grid["height"] - 1).astype(np.intp)
+    cols = np.clip(np.nan_to_num(cols), 0, common_grid["width"] - 1).astype(np.intp)
+    return rows, cols, inside
+
+
+def _to_json(values: np.ndarray, inside: np.ndarray, layer: str) -> List[Optional[float]]:
+    # NaN (and the 255 land cover nodata class) become None.
+    if get_layer(layer).cmap is None:
+        missing = values == 255
+    else:
+        missing = ~np.isfinite(values)
+    missing = missing | ~inside
+    return [None if m else v for v, m in zip(values.tolist(), missing.tolist())]
+
+
+def sample(layer: str, pixels, year: int = 0) -> List[Optional[float]]:
+    """
+    Values of one layer/year index at pixels from lonlat_to_pixels (None outside the grid or on nodata).
+    """
+    rows, cols, inside = pixels
+    grid, _ = layer_source(layer, year)
+    return _to_json(grid[rows, cols], inside, layer)
+
+
+def point_values(layer: str, lon, lat, year: int = 0) -> List[Optional[float]]:
+    return sample(layer, lonlat_to_pixels(lon, lat), year)
+
+
+def timeseries(layer: str, lon: float, lat: float) -> List[Optional[float]]:
+    """
+    The value of a layer at one coordinate for every year of its stack.
+    """
+    rows, cols, inside = lonlat_to_pixels(lon, lat)
+    stack, _ = layer_stack(layer, slice(None))
+    return _to_json(stack[:, rows[0], cols[0]], np.repeat(inside, len(stack)), layer)
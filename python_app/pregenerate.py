@@ -0,0 +1,164 @@
+"""
+Pre-render the XYZ tile pyramid served by /tiles into a directory tree.
+
+Run from the repository root, e.g.:
+    python -m python_app.pregenerate --out ./tile_pyramid --min-zoom 8 --max-zoom 12 --workers 8
+
+Tiles are written to <out>/<layer>/<year>/<z>/<x>/<y>.png. Derived (analytics) layers do not
+change with the year, so their tiles are rendered once into <out>/<layer>/all/ and the manifest
+aliases every year to that directory. A manifest.json in <out> records, per layer, a fingerprint
+of the dataset folders it is derived from.
+Re-running the command skips tiles that already exist for a layer whose datasets are
+unchanged (so an interrupted run resumes), and re-renders a layer from scratch when
+one of its dataset folders changed. Point the API at the result with
+TILE_PYRAMID_DIR=<out>.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from python_app.data_loader import common_grid, layer_registry
+from python_app.tiles import SHARED_YEARS_DIR, TILE_SIZE, pyramid_tile_path
+from python_app.visualizer import LAYERS, get_layer, layer_datasets, render_tile
+
+# 2: tiles are sampled in Web Mercator (earlier pyramids have seams between tile rows).
+# 3: tiles are coloured with the layer's fixed tile_range instead of autoscaling on each tile.
+RENDER_VERSION = 3
+YEARS = range(2010, 2024)
+
+def layer_fingerprint(layer: str) -> str:
+    # The registry cache keys already cover the source folders (and mask datasets) of each stack.
+    digest = hashlib.sha1(f"render-v{RENDER_VERSION}:{TILE_SIZE};".encode())
+    for dataset in layer_datasets(layer):
+        digest.update(f"{dataset}={layer_registry.key(dataset)};".encode())
+    return digest.hexdigest()
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int):
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def data_bounds_lonlat():
+    """
+    WGS84 bounding box (west, south, east, north) of the common grid.
+    """
+    from pyproj import Transformer
+
+    transform = common_grid["transform"]
+    left, top = transform * (0, 0)
+    right, bottom = transform * (common_grid["width"], common_grid["height"])
+    transformer = Transformer.from_crs(common_grid["crs"], "EPSG:4326", always_xy=True)
+    return transformer.transform_bounds(left, bottom, right, top, densify_pts=21)
+
+
+def tiles_for_bounds(bounds, min_zoom: int, max_zoom: int):
+    west, south, east, north = bounds
+    for z in range(min_zoom, max_zoom + 1):
+        x_min, y_min = lonlat_to_tile(west, north, z)
+        x_max, y_max = lonlat_to_tile(east, south, z)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield z, x, y
+
+
+def render_tile_job(job):
+    out_dir, layer, year, z, x, y = job
+    path = pyramid_tile_path(out_dir, layer, year, z, x, y)
+    if os.path.exists(path):
+        return False
+
+    png_bytes = render_tile(layer, z, x, y, year=0 if year == SHARED_YEARS_DIR else year - 2010).getvalue()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write-then-rename so an interrupted run never leaves a truncated tile behind.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(png_bytes)
+    os.replace(tmp_path, path)
+    return True
+
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(out_dir: str, manifest: dict):
+    tmp_path = os.path.join(out_dir, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, "manifest.json"))
+
+
+def generate(out_dir: str, layers, years, min_zoom: int, max_zoom: int, workers=None):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    settings = {"min_zoom": min_zoom, "max_zoom": max_zoom, "years": list(years)}
+
+    pending = []
+    for layer in layers:
+        fingerprint = layer_fingerprint(layer)
+        entry = manifest.get(layer)
+        if entry and entry["fingerprint"] == fingerprint:
+            if entry["complete"] and entry["settings"] == settings:
+                print(f"{layer}: up to date")
+                continue
+            print(f"{layer}: resuming")
+        else:
+            if entry:
+                print(f"{layer}: dataset changed, regenerating")
+                shutil.rmtree(os.path.join(out_dir, layer), ignore_errors=True)
+            else:
+                print(f"{layer}: generating")
+        manifest[layer] = {"fingerprint": fingerprint, "complete": False, "settings": settings}
+        if get_layer(layer).derived:
+            manifest[layer]["year_alias"] = SHARED_YEARS_DIR
+        pending.append(layer)
+    save_manifest(out_dir, manifest)
+    if not pending:
+        return
+
+    # Load the datasets once in this process so forked workers share them copy-on-write.
+    from python_app.analytics import warm_up
+    warm_up()
+    tiles = list(tiles_for_bounds(data_bounds_lonlat(), min_zoom, max_zoom))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for layer in pending:
+            start = time.perf_counter()
+            layer_years = [manifest[layer]["year_alias"]] if "year_alias" in manifest[layer] else years
+            jobs = [(out_dir, layer, year, z, x, y) for year in layer_years for z, x, y in tiles]
+            rendered = sum(executor.map(render_tile_job, jobs, chunksize=64))
+            manifest[layer]["complete"] = True
+            save_manifest(out_dir, manifest)
+            print(f"{layer}: {rendered} tiles rendered, {len(jobs) - rendered} reused "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the /tiles pyramid to disk.")
+    parser.add_argument("--out", required=True, help="Output directory of the pyramid")
+    parser.add_argument("--min-zoom", type=int, default=8)
+    parser.add_argument("--max-zoom", type=int, default=12)
+    parser.add_argument("--layers", nargs="+", choices=sorted(LAYERS), default=list(LAYERS))
+    parser.add_argument("--years", nargs="+", type=int, default=list(YEARS))
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if not set(args.years) <= set(YEARS):
+        parser.error(f"years must be between {YEARS.start} and {YEARS.stop - 1}")
+    generate(args.out, args.layers, sorted(args.years), args.min_zoom, args.max_zoom, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from starlette.requests import Request
+
+# Rendering is numpy/GDAL/Pillow work that releases the GIL, and the datasets are shared
+# read-only, so a thread pool gives parallelism without copying any stack into other processes.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 4))
+# Renders allowed in flight (running + queued) before new requests are turned away with 503.
+RENDER_MAX_PENDING = int(os.environ.get("RENDER_MAX_PENDING", RENDER_WORKERS * 4))
+RETRY_AFTER_SECONDS = 1
+DISCONNECT_POLL_SECONDS = 0.05
+
+
+class RenderPoolSaturated(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class RenderPool:
+    """
+    Dedicated, bounded executor for CPU-heavy rendering called from async handlers.
+
+    At most max_pending renders are admitted at a time; further requests fail fast with
+    RenderPoolSaturated instead of queueing without bound. While a render waits or runs, the
+    client connection is polled and the render is dropped if the client went away (Leaflet
+    aborts superseded requests), cancelling it outright if it has not started yet.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, max_pending: int = RENDER_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def _release(self, future):
+        self.pending -= 1
+        if future.cancelled():
+            self.cancelled += 1
+        else:
+            self.completed += 1
+
+    async def run(self, request: Optional[Request], fn: Callable, *args, **kwargs):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RenderPoolSaturated()
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        # The slot is only released once the work has really finished (or was cancelled before
+        # starting), so abandoned renders still count against the limit while they occupy a thread.
+        # The render runs in a copy of the caller's context, so it sees the request's pinned registry state.
+        future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+
+        result = asyncio.wrap_future(future)
+        while True:
+            done, _ = await asyncio.wait({result}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return result.result()
+            if request is not None and await request.is_disconnected():
+                # Cancels the executor future too if the render has not started yet.
+                result.cancel()
+                raise ClientDisconnected()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
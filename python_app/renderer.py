@@ -0,0 +1,199 @@
+import io
+from functools import lru_cache
+
+import numpy as np
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.colors as mcolors
+from PIL import Image
+
+# Row layout of every lookup table built here: N colours followed by the
+# matplotlib "under", "over" and "bad" colours.
+LUT_SIZE = 256
+I_UNDER = LUT_SIZE
+I_OVER = LUT_SIZE + 1
+I_BAD = LUT_SIZE + 2
+
+LAND_COVER_CLASSES = {
+    0: ("Water", "#1f78b4"),
+    1: ("Evergreen Needleleaf Forest", "#33a02c"),
+    2: ("Evergreen Broadleaf Forest", "#b2df8a"),
+    3: ("Deciduous Needleleaf Forest", "#006400"),
+    4: ("Deciduous Broadleaf Forest", "#8dd3c7"),
+    5: ("Mixed Forest", "#ffffb3"),
+    6: ("Closed Shrublands", "#8B4513"),
+    7: ("Open Shrublands", "#bc8f8f"),
+    8: ("Woody Savannas", "#d9d9d9"),
+    9: ("Savannas", "#fdbf6f"),
+    10: ("Grasslands", "#55FF55"),
+    11: ("Permanent Wetlands", "#1ecbe1"),
+    12: ("Croplands", "#00FFFF"),
+    13: ("Urban and Built-Up Lands", "#FF0000"),
+    14: ("Cropland/Natural Vegetation", "#00FFFF"),
+    15: ("Snow and Ice", "#ffffff"),
+    16: ("Barren or sparsely vegetated", "#FFFFAA"),
+    17: ("Fill Value/Unclassified", "#00000000")
+}
+
+
+def _to_bytes(rgba) -> np.ndarray:
+    # Same float -> uint8 conversion matplotlib applies for ``bytes=True``.
+    return (np.asarray(rgba, dtype=float) * 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=None)
+def continuous_lut(cmap_name: str) -> np.ndarray:
+    """
+    Build the (LUT_SIZE + 3, 4) uint8 RGBA table for a named matplotlib colormap.
+    The table is read-only and shared between threads.
+    """
+    cmap = matplotlib.colormaps[cmap_name]
+    if cmap.N != LUT_SIZE:
+        cmap = cmap.resampled(LUT_SIZE)
+    lut = np.empty((LUT_SIZE + 3, 4), dtype=np.uint8)
+    lut[:LUT_SIZE] = cmap(np.arange(LUT_SIZE), bytes=True)
+    lut[I_UNDER] = _to_bytes(cmap.get_under())
+    lut[I_OVER] = _to_bytes(cmap.get_over())
+    lut[I_BAD] = _to_bytes(cmap.get_bad())
+    lut.flags.writeable = False
+    return lut
+
+
+@lru_cache(maxsize=None)
+def land_cover_lut() -> np.ndarray:
+    """
+    Build a 256-entry RGBA table indexed directly by the uint8 land cover class.
+
+    This is the ListedColormap/BoundaryNorm pair formerly used by
+    visualize_land_cutout, evaluated once for every possible byte value:
+    classes above the last boundary take the "over" colour and the 255 nodata
+    value takes the "bad" colour.
+    """
+    sorted_keys = sorted(LAND_COVER_CLASSES.keys())
+    color_list = [LAND_COVER_CLASSES[k][1] for k in sorted_keys]
+    cmap = mcolors.ListedColormap(color_list, name='LandCoverMap')
+    boundaries = sorted_keys + [max(sorted_keys) + 1]
+    norm = mcolors.BoundaryNorm(boundaries, cmap.N)
+
+    values = np.arange(256, dtype=np.float32)
+    values[255] = np.nan
+    lut = cmap(norm(np.ma.masked_invalid(values)), bytes=True)
+    lut.flags.writeable = False
+    return lut
+
+
+def continuous_indices(array: np.ndarray, vmin=None, vmax=None) -> np.ndarray:
+    """
+    Map a 2D array onto row indices of a continuous_lut table.
+
+    Follows matplotlib's Normalize + Colormap arithmetic step by step (float32
+    input stays float32, limits are autoscaled from the finite pixels) so the
+    resulting colours are byte-identical to ``cmap(norm(array), bytes=True)``.
+    """
+    work = np.array(array, copy=True)
+    if work.dtype.kind != 'f':
+        work = work.astype(np.promote_types(work.dtype, np.float32))
+    mask_bad = ~np.isfinite(work)
+    indices = np.full(work.shape, I_BAD, dtype=np.intp)
+    if mask_bad.all():
+        return indices
+
+    valid = work[~mask_bad]
+    vmin = float(valid.min()) if vmin is None else float(vmin)
+    vmax = float(valid.max()) if vmax is None else float(vmax)
+    if vmin > vmax:
+        raise ValueError("minvalue must be less than or equal to maxvalue")
+
+    if vmin == vmax:
+        work.fill(0)
+    else:
+        work -= np.float64(vmin)
+        work /= np.float64(vmax) - np.float64(vmin)
+    work *= LUT_SIZE
+    work[work == LUT_SIZE] = LUT_SIZE - 1
+    mask_under = work < 0
+    mask_over = work >= LUT_SIZE
+    with np.errstate(invalid='ignore'):
+        indices[...] = work.astype(np.intp)
+    indices[mask_under] = I_UNDER
+    indices[mask_over] = I_OVER
+    indices[mask_bad] = I_BAD
+    return indices
+
+
+def encode_rgba(rgba: np.ndarray, image_format: str = 'png') -> io.BytesIO:
+    """
+    Encode an (H, W, 4) uint8 array as PNG or lossless WebP into a rewound buffer.
+    """
+    image_format = image_format.lower()
+    buffer = io.BytesIO()
+    image = Image.fromarray(np.ascontiguousarray(rgba, dtype=np.uint8))
+    if image_format == 'png':
+        image.save(buffer, format='PNG', compress_level=6)
+    elif image_format == 'webp':
+        image.save(buffer, format='WEBP', lossless=True)
+    else:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    buffer.seek(0)
+    return buffer
+
+
+def composite_rgba(layers) -> np.ndarray:
+    """
+    Alpha-composite (H, W, 4) uint8 RGBA images with the "over" operator, first image at the bottom.
+    """
+    layers = list(layers)
+    if not layers:
+        raise ValueError("Nothing to composite")
+    out_rgb = np.zeros(layers[0].shape[:2] + (3,), dtype=np.float32)
+    out_alpha = np.zeros(layers[0].shape[:2] + (1,), dtype=np.float32)
+    for rgba in layers:
+        alpha = rgba[..., 3:].astype(np.float32) / 255
+        # Straight (non-premultiplied) colours: blend in premultiplied space, divide out at the end.
+        out_rgb *= 1 - alpha
+        out_rgb += rgba[..., :3] * alpha
+        out_alpha *= 1 - alpha
+        out_alpha += alpha
+    np.divide(out_rgb, out_alpha, out=out_rgb, where=out_alpha > 0)
+    out = np.empty(layers[0].shape[:2] + (4,), dtype=np.uint8)
+    out[..., :3] = np.clip(np.rint(out_rgb), 0, 255)
+    out[..., 3:] = np.rint(out_alpha * 255)
+    return out
+
+
+def encode_animation(frames, image_format: str = 'png', duration_ms: int = 500) -> io.BytesIO:
+    """
+    Encode a sequence of (H, W, 4) uint8 frames as a looping APNG or lossless animated WebP.
+    """
+    image_format = image_format.lower()
+    images = [Image.fromarray(np.ascontiguousarray(rgba, dtype=np.uint8)) for rgba in frames]
+    if not images:
+        raise ValueError("An animation needs at least one frame")
+    buffer = io.BytesIO()
+    options = dict(save_all=True, append_images=images[1:], duration=duration_ms, loop=0)
+    if image_format == 'png':
+        images[0].save(buffer, format='PNG', compress_level=6, **options)
+    elif image_format == 'webp':
+        images[0].save(buffer, format='WEBP', lossless=True, **options)
+    else:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    buffer.seek(0)
+    return buffer
+
+
+def colorize_continuous(array: np.ndarray, cmap_name: str, vmin=None, vmax=None) -> np.ndarray:
+    return continuous_lut(cmap_name).take(continuous_indices(array, vmin, vmax), axis=0)
+
+
+def colorize_land_cover(array: np.ndarray) -> np.ndarray:
+    return land_cover_lut().take(np.asarray(array, dtype=np.uint8), axis=0)
+
+
+def render_continuous(array: np.ndarray, cmap_name: str, vmin=None, vmax=None,
+                      image_format: str = 'png') -> io.BytesIO:
+    return encode_rgba(colorize_continuous(array, cmap_name, vmin, vmax), image_format)
+
+
+def render_land_cover(array: np.ndarray, image_format: str = 'png') -> io.BytesIO:
+    return encode_rgba(colorize_land_cover(array), image_format)
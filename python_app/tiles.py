@@ -0,0 +1,167 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple, Union
+
+from affine import Affine
+
+TILE_SIZE = 256
+TILE_CACHE_BYTES = int(os.environ.get("TILE_CACHE_BYTES", 64 * 1024 * 1024))
+TILE_CACHE_CONTROL = "public, max-age=86400"
+# Directory written by python -m python_app.pregenerate; tiles found there are served without rendering.
+TILE_PYRAMID_DIR = os.environ.get("TILE_PYRAMID_DIR")
+TILE_CRS = "EPSG:3857"
+# Half the width of the Web Mercator world, in metres.
+MERCATOR_EXTENT = math.pi * 6378137.0
+# Year directory of the pyramid layers whose tiles are the same every year (see pregenerate).
+SHARED_YEARS_DIR = "all"
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    Return (lon_west, lat_north, lon_east, lat_south) of a Web Mercator XYZ tile,
+    in the corner order reproject_overlay expects.
+    """
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the tile grid")
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x), lat(y), lon(x + 1), lat(y + 1)
+
+
+def tile_transform(z: int, x: int, y: int, size: int = TILE_SIZE) -> Affine:
+    """
+    Affine transform of a size x size XYZ tile in Web Mercator (TILE_CRS) metres.
+    """
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the tile grid")
+    span = 2 * MERCATOR_EXTENT / n
+    return Affine(span / size, 0.0, -MERCATOR_EXTENT + x * span, 0.0, -span / size, MERCATOR_EXTENT - y * span)
+
+
+def tile_ground_pixel(z: int, y: int, size: int = TILE_SIZE) -> float:
+    """
+    Ground size in metres of a pixel at the centre of a tile (Mercator metres shrink by cos(lat)).
+    """
+    n = 2 ** z
+    lat = math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n)))
+    return 2 * MERCATOR_EXTENT / n / size * math.cos(lat)
+
+
+def pyramid_tile_path(pyramid_dir: str, layer: str, year: Union[int, str], z: int, x: int, y: int) -> str:
+    return os.path.join(pyramid_dir, layer, str(year), str(z), str(x), f"{y}.png")
+
+
+# (manifest mtime, aliases) last read by _pyramid_year_aliases.
+_year_aliases: Tuple[Optional[int], Dict[str, str]] = (None, {})
+
+
+def _pyramid_year_aliases(pyramid_dir: str) -> Dict[str, str]:
+    """
+    Layer -> year directory shared by all years, from the pyramid manifest (re-read when it changes).
+    """
+    global _year_aliases
+    path = os.path.join(pyramid_dir, "manifest.json")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _year_aliases[0] != mtime:
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return _year_aliases[1]
+        _year_aliases = (mtime, {layer: entry["year_alias"] for layer, entry in manifest.items()
+                                 if "year_alias" in entry})
+    return _year_aliases[1]
+
+
+def read_pyramid_tile(layer: str, year: int, z: int, x: int, y: int) -> Optional[bytes]:
+    if not TILE_PYRAMID_DIR:
+        return None
+    year = _pyramid_year_aliases(TILE_PYRAMID_DIR).get(layer, year)
+    try:
+        with open(pyramid_tile_path(TILE_PYRAMID_DIR, layer, year, z, x, y), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class CachedTile(NamedTuple):
+    content: bytes
+    etag: str
+
+
+def make_etag(content: bytes) -> str:
+    return '"' + hashlib.blake2b(content, digest_size=16).hexdigest() + '"'
+
+
+class TileCache:
+    """
+    Thread-safe LRU cache of encoded tiles bounded by the total size of the stored bytes.
+    """
+
+    def __init__(self, max_bytes: int = TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CachedTile]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key: Hashable, content: bytes) -> CachedTile:
+        tile = CachedTile(content, make_etag(content))
+        size = len(content)
+        if size > self.max_bytes:
+            return tile
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous.content)
+            self._tiles[key] = tile
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self.current_bytes -= len(evicted.content)
+                self.evictions += 1
+        return tile
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tiles": len(self._tiles),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,14 +1,17 @@
-import io
+import warnings
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple, get_args
+
 import numpy as np
-import matplotlib
+from rasterio.enums import Resampling
 
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from python_app.data_loader import common_grid, modis_land_raster_datastruct, modis_gpp_datastruct, \
-    climate_precipitation_datastruct, population_density_datastruct, glw_sheep_datastruct, glw_goat_datastruct, \
-    glw_cattle_datastruct
-from python_app.analytics import reproject_overlay, animals_desertification, animal_gpp, change_vegetation
+from python_app import grid_cache
+from python_app.data_loader import OnceCache, Overview, cached_overviews, common_grid, layer_registry
+from python_app.analytics import (DERIVED_ANALYSES, DERIVED_LAYERS, Analysis, derived_grid, get_analysis, get_derived,
+                                  overlay_native_size, overlay_transform, warp_overlay)
+from python_app.models import AllowedLayer
+from python_app.renderer import colorize_continuous, colorize_land_cover, composite_rgba, encode_animation, encode_rgba
+from python_app.tiles import TILE_CRS, TILE_SIZE, tile_ground_pixel, tile_transform
 
 
 def replace_nodata_with_nan(array, nodata_val=65535.0):
@@ -17,6 +20,8 @@ def replace_nodata_with_nan(array, nodata_val=65535.0):
 
 
 def visualize(data):
+    # Debug helper only; the API renders through python_app.renderer and never touches pyplot.
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 8))
     img = plt.imshow(data, cmap='viridis')
     plt.title(f"Raster Visualization test")
@@ -26,288 +31,308 @@ def visualize(data):
     plt.show()
 
 
-def visualize_animal_desertifation_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = animals_desertification
-    dst_array, dst_transform = reproject_overlay(
-        data,
-        lon1, lat1, lon2, lat2
-    )
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='Spectral')
-    ax.set_axis_off()  # Remove axes, ticks, labels
-
-    # Save to in-memory buffer with no extra margins
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    # Rewind the BytesIO buffer
-    png_bytes.seek(0)
-    return png_bytes
-
-
-def visualize_animal_gpp_change_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = animal_gpp
-    dst_array, dst_transform = reproject_overlay(
-        data,
-        lon1, lat1, lon2, lat2
-    )
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='RdGy')
-    ax.set_axis_off()  # Remove axes, ticks, labels
-
-    # Save to in-memory buffer with no extra margins
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    # Rewind the BytesIO buffer
-    png_bytes.seek(0)
-    return png_bytes
-
-
-def visualize_vegetation_change_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = change_vegetation
-    dst_array, dst_transform = reproject_overlay(
-        data,
-        lon1, lat1, lon2, lat2
-    )
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='plasma')
-    ax.set_axis_off()  # Remove axes, ticks, labels
-
-    # Save to in-memory buffer with no extra margins
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    # Rewind the BytesIO buffer
-    png_bytes.seek(0)
-    return png_bytes
-
-
-def visualize_gpp_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = modis_gpp_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = modis_gpp_datastruct.dtype
-    meta['nodata'] = modis_gpp_datastruct.nodata
-    data_nan = np.where(data >= 6500, np.nan, data)
-    max_val = np.nanmax(data_nan)
-    # Reproject overlay
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year],
-        lon1, lat1, lon2, lat2
-    )
-    # Replace nodata
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='BuGn', vmax=max_val)
-    ax.set_axis_off()  # Remove axes, ticks, labels
-
-    # Save to in-memory buffer with no extra margins
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    # Rewind the BytesIO buffer
-    png_bytes.seek(0)
-    return png_bytes
-
-
-def visualize_land_cutout(lon1, lat1, lon2, lat2, year=0):
-    """
-    Perform the cutout and return a PNG bytes object, with only the image shown.
-    """
-    data = modis_land_raster_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = modis_land_raster_datastruct.dtype
-    meta['nodata'] = modis_land_raster_datastruct.nodata
-
-    # Reproject overlay
-    dst_array, dst_transform = reproject_overlay(
-        data[year],
-        lon1, lat1, lon2, lat2,
-    )
-    # Replace nodata
-    data_nan = replace_nodata_with_nan(dst_array, nodata_val=meta['nodata'])
-    meta['transform'] = dst_transform
-
-    # Define categorical classes (example)
-    classes = {
-        0: ("Water", "#1f78b4"),
-        1: ("Evergreen Needleleaf Forest", "#33a02c"),
-        2: ("Evergreen Broadleaf Forest", "#b2df8a"),
-        3: ("Deciduous Needleleaf Forest", "#006400"),
-        4: ("Deciduous Broadleaf Forest", "#8dd3c7"),
-        5: ("Mixed Forest", "#ffffb3"),
-        6: ("Closed Shrublands", "#8B4513"),
-        7: ("Open Shrublands", "#bc8f8f"),
-        8: ("Woody Savannas", "#d9d9d9"),
-        9: ("Savannas", "#fdbf6f"),
-        10: ("Grasslands", "#55FF55"),
-        11: ("Permanent Wetlands", "#1ecbe1"),
-        12: ("Croplands", "#00FFFF"),
-        13: ("Urban and Built-Up Lands", "#FF0000"),
-        14: ("Cropland/Natural Vegetation", "#00FFFF"),
-        15: ("Snow and Ice", "#ffffff"),
-        16: ("Barren or sparsely vegetated", "#FFFFAA"),
-        17: ("Fill Value/Unclassified", "#00000000")
-    }
-
-    sorted_keys = sorted(classes.keys())
-    color_list = [classes[k][1] for k in sorted_keys]
-    cmap = mcolors.ListedColormap(color_list, name='LandCoverMap')
-    boundaries = sorted_keys + [max(sorted_keys) + 1]
-    norm = mcolors.BoundaryNorm(boundaries, cmap.N)
-
-    # Create figure in memory
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(data_nan, cmap=cmap, norm=norm)
-    ax.set_axis_off()  # Remove axes, ticks, labels
-
-    # Save to in-memory buffer with no extra margins
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    # Rewind the BytesIO buffer
-    png_bytes.seek(0)
-    return png_bytes
-
-
-# Climate Precipitation
-def visualize_precipitation_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = climate_precipitation_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = climate_precipitation_datastruct.dtype
-    meta['nodata'] = climate_precipitation_datastruct.nodata
-    data_nan = np.where(data == meta['nodata'], np.nan, data)
-    max_val = np.nanmax(data_nan)
-
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year], lon1, lat1, lon2, lat2
-    )
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='Blues', vmax=max_val)
-    ax.set_axis_off()
-
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    png_bytes.seek(0)
-    return png_bytes
-
-
-# Population Density
-def visualize_population_density_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = population_density_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = population_density_datastruct.dtype
-    meta['nodata'] = population_density_datastruct.nodata
-    data_nan = np.where(data == meta['nodata'], np.nan, data)
-    max_val = np.nanmax(data_nan)
-
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year], lon1, lat1, lon2, lat2
-    )
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='OrRd', vmax=max_val)
-    ax.set_axis_off()
-
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    png_bytes.seek(0)
-    return png_bytes
-
-
-# GLW Sheep
-def visualize_glw_sheep_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = glw_sheep_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = glw_sheep_datastruct.dtype
-    meta['nodata'] = glw_sheep_datastruct.nodata
-    data_nan = np.where(data == meta['nodata'], np.nan, data)
-    max_val = np.nanmax(data_nan)
-
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year], lon1, lat1, lon2, lat2
-    )
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='Purples', vmax=max_val)
-    ax.set_axis_off()
-
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    png_bytes.seek(0)
-    return png_bytes
-
-
-# GLW Goat
-def visualize_glw_goat_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = glw_goat_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = glw_goat_datastruct.dtype
-    meta['nodata'] = glw_goat_datastruct.nodata
-    data_nan = np.where(data == meta['nodata'], np.nan, data)
-    max_val = np.nanmax(data_nan)
-
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year], lon1, lat1, lon2, lat2
-    )
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='Greys', vmax=max_val)
-    ax.set_axis_off()
-
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    png_bytes.seek(0)
-    return png_bytes
-
-
-# GLW Cattle
-def visualize_glw_cattle_cutout(lon1, lat1, lon2, lat2, year=0):
-    data = glw_cattle_datastruct.array
-    meta = common_grid.copy()
-    meta['dtype'] = glw_cattle_datastruct.dtype
-    meta['nodata'] = glw_cattle_datastruct.nodata
-    data_nan = np.where(data == meta['nodata'], np.nan, data)
-    max_val = np.nanmax(data_nan)
-
-    dst_array, dst_transform = reproject_overlay(
-        data_nan[year], lon1, lat1, lon2, lat2
-    )
-
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.imshow(dst_array, cmap='YlOrBr', vmax=max_val)
-    ax.set_axis_off()
-
-    png_bytes = io.BytesIO()
-    fig.patch.set_alpha(0)
-    fig.savefig(png_bytes, format='png', bbox_inches='tight', pad_inches=0, transparent=True)
-    plt.close(fig)
-
-    png_bytes.seek(0)
-    return png_bytes
+@dataclass(frozen=True)
+class RenderLayer:
+    """
+    How one API layer is cut out and coloured.
+
+    - source: dataset name in layer_registry, or derived analytics grid name if derived is set.
+      Nodata handling comes from the dataset's DatasetSpec.nodata_rule (via its masked stack).
+    - cmap: matplotlib colormap name; None renders the categorical land cover lookup table.
+    - vmax: "global" (max over all years), "year" (max of the requested year) or None to
+      autoscale on the cutout itself. Map tiles never autoscale (see tile_range).
+    - resampling: resampling used when warping the grid into the cutout.
+    """
+    source: str
+    cmap: Optional[str] = None
+    vmax: Optional[str] = "global"
+    derived: bool = False
+    resampling: Resampling = Resampling.nearest
+
+
+LAYERS = {
+    "land": RenderLayer("modis_land", cmap=None, vmax=None),
+    "gpp": RenderLayer("modis_gpp", cmap="BuGn"),
+    "population": RenderLayer("population_density", cmap="OrRd"),
+    "precipitation": RenderLayer("climate_precipitation", cmap="Blues"),
+    "goat": RenderLayer("glw_goat", cmap="Greys"),
+    "cattle": RenderLayer("glw_cattle", cmap="YlOrBr"),
+    "sheep": RenderLayer("glw_sheep", cmap="Purples"),
+    "vegetation_change": RenderLayer("change_vegetation", cmap="plasma", vmax=None, derived=True),
+    "animal_gpp": RenderLayer("animal_gpp", cmap="RdGy", vmax=None, derived=True),
+    "animal_desertification": RenderLayer("animals_desertification", cmap="Spectral", vmax=None, derived=True),
+}
+
+assert set(LAYERS) == set(get_args(AllowedLayer)), "LAYERS and models.AllowedLayer are out of sync"
+
+
+def get_layer(layer: str) -> RenderLayer:
+    try:
+        return LAYERS[layer]
+    except KeyError:
+        raise ValueError(f"Unknown layer: {layer}")
+
+
+def layer_datasets(layer: str) -> Tuple[str, ...]:
+    """
+    The layer_registry datasets a layer is rendered from.
+    """
+    render_layer = get_layer(layer)
+    if render_layer.derived:
+        return DERIVED_LAYERS[render_layer.source][1]
+    return (render_layer.source,)
+
+
+def layer_source(layer: str, year: int = 0) -> Tuple[np.ndarray, Optional[float]]:
+    """
+    Return the 2D grid to cut out for a layer/year index and the vmax it is coloured with.
+    """
+    render_layer = get_layer(layer)
+    if render_layer.derived:
+        return get_derived(render_layer.source), None
+    if render_layer.cmap is None:
+        return layer_registry.datastruct(render_layer.source).array[year], None
+
+    masked = layer_registry.masked(render_layer.source)
+    if render_layer.vmax == "global":
+        vmax = masked.stats.global_max
+    elif render_layer.vmax == "year":
+        vmax = masked.stats.year_max[year]
+    else:
+        vmax = None
+    return masked.array[year], vmax
+
+
+def layer_stack(layer: str, years: slice) -> Tuple[np.ndarray, List[Optional[float]]]:
+    """
+    Return the [year, rows, columns] grids of a layer for a slice of year indices and the vmax
+    each year is coloured with. Derived layers have no per-year data and raise ValueError.
+    """
+    render_layer = get_layer(layer)
+    if render_layer.derived:
+        raise ValueError(f"Layer {layer} is a single analytics grid without per-year data")
+    if render_layer.cmap is None:
+        stack = layer_registry.datastruct(render_layer.source).array[years]
+        return stack, [None] * len(stack)
+
+    masked = layer_registry.masked(render_layer.source)
+    stack = masked.array[years]
+    if render_layer.vmax == "global":
+        vmaxes = [masked.stats.global_max] * len(stack)
+    elif render_layer.vmax == "year":
+        vmaxes = list(masked.stats.year_max[years])
+    else:
+        vmaxes = [None] * len(stack)
+    return stack, vmaxes
+
+
+_derived_overviews = OnceCache()
+_derived_ranges = OnceCache()
+
+
+def tile_range(layer: str, year: int = 0) -> Tuple[Optional[float], Optional[float]]:
+    """
+    The (vmin, vmax) map tiles of a layer/year index are coloured with. Unlike cutouts, tiles must not
+    autoscale on their own pixels: the same value has to get the same colour in neighbouring tiles.
+    """
+    render_layer = get_layer(layer)
+    if render_layer.cmap is None:
+        return None, None
+    if render_layer.derived:
+        grid = derived_grid(render_layer.source)
+
+        def extremes():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                return float(np.nanmin(grid.array)), float(np.nanmax(grid.array))
+
+        return _derived_ranges.get(grid.key, extremes)
+    stats = layer_registry.masked(render_layer.source).stats
+    _, vmax = layer_source(layer, year)
+    return stats.global_min, stats.global_max if vmax is None else vmax
+
+
+def layer_overviews(layer: str) -> Tuple[Overview, ...]:
+    render_layer = get_layer(layer)
+    if render_layer.derived:
+        name = render_layer.source
+        grid = derived_grid(name)
+        return _derived_overviews.get(grid.key, lambda: cached_overviews(
+            name, grid_cache.cache_key("derived", grid.key), lambda: grid.array[None]))
+    return layer_registry.overviews(render_layer.source)
+
+
+def overview_source(layer: str, data: np.ndarray, year, subset_transform):
+    """
+    Swap a layer's full-resolution grid (or year slice) for the coarsest overview level whose pixels
+    are still no larger than the cutout's, so zoomed-out renders do not resample pixels that are
+    averaged away. Returns (grid, src_transform for warp_overlay; None for the full grid).
+    """
+    return overview_for_pixel(layer, data, year, min(abs(subset_transform.a), abs(subset_transform.e)))
+
+
+def overview_for_pixel(layer: str, data: np.ndarray, year, pixel: float):
+    """
+    overview_source for a destination pixel of the given ground size in metres.
+    """
+    grid_pixel = max(abs(common_grid["transform"].a), abs(common_grid["transform"].e))
+    if pixel < 2 * grid_pixel:
+        return data, None
+    chosen = None
+    for overview in layer_overviews(layer):
+        if overview.factor * grid_pixel <= pixel:
+            chosen = overview
+    if chosen is None:
+        return data, None
+    return chosen.array[0 if get_layer(layer).derived else year], chosen.transform
+
+
+def colorize(layer: str, array: np.ndarray, vmax: Optional[float] = None, vmin: Optional[float] = None) -> np.ndarray:
+    render_layer = get_layer(layer)
+    if render_layer.cmap is None:
+        return colorize_land_cover(array)
+    return colorize_continuous(array, render_layer.cmap, vmin=vmin, vmax=vmax)
+
+
+def layer_analysis(layer: str, year_from: Optional[int] = None, year_to: Optional[int] = None,
+                   kernel: Optional[str] = None) -> Analysis:
+    """
+    The analysis behind a derived layer, with any of its years (indices) or kernel replaced.
+    """
+    render_layer = get_layer(layer)
+    if not render_layer.derived:
+        raise ValueError(f"Layer {layer} is not an analytics layer")
+    overrides = {"year_from": year_from, "year_to": year_to, "kernel": kernel}
+    return replace(DERIVED_ANALYSES[render_layer.source],
+                   **{field: value for field, value in overrides.items() if value is not None}).validate()
+
+
+def render_analysis(analysis: Analysis, cmap: str, lon1, lat1, lon2, lat2, dst_width=854, dst_height=480,
+                    image_format='png'):
+    """
+    Cut out, colour and encode the grid of any analysis, computed on first use.
+    """
+    subset_transform = overlay_transform(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    dst_array = warp_overlay(get_analysis(analysis), subset_transform, dst_width, dst_height, Resampling.nearest)
+    return encode_rgba(colorize_continuous(dst_array, cmap), image_format)
+
+
+def render_cutout(layer, lon1, lat1, lon2, lat2, year=0, dst_width=854, dst_height=480, image_format='png'):
+    """
+    Cut out, colour and encode one layer; returns a rewound BytesIO holding the image.
+    """
+    render_layer = get_layer(layer)
+    subset_transform = overlay_transform(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    data, vmax = layer_source(layer, year)
+    data, src_transform = overview_source(layer, data, year, subset_transform)
+    dst_array = warp_overlay(data, subset_transform, dst_width, dst_height, render_layer.resampling, src_transform)
+    return encode_rgba(colorize(layer, dst_array, vmax), image_format)
+
+
+def mercator_rgba(layer, transform, dst_width, dst_height, ground_pixel, year=0) -> np.ndarray:
+    """
+    Colour a Web Mercator area of a layer with its fixed tile_range. Every pixel is sampled where its own
+    centre falls on the grid, so areas that share an edge line up exactly (a lon/lat rectangle of the
+    sinusoidal grid would not). ground_pixel (metres) picks the overview level.
+    """
+    render_layer = get_layer(layer)
+    data, _ = layer_source(layer, year)
+    data, src_transform = overview_for_pixel(layer, data, year, ground_pixel)
+    dst_array = warp_overlay(data, transform, dst_width, dst_height, render_layer.resampling, src_transform,
+                             dst_crs=TILE_CRS)
+    vmin, vmax = tile_range(layer, year)
+    return colorize(layer, dst_array, vmax, vmin)
+
+
+def render_tile(layer, z, x, y, year=0, image_format='png'):
+    """
+    Render one Web Mercator XYZ tile; neighbouring tiles match one render spanning them, colours included.
+    """
+    rgba = mercator_rgba(layer, tile_transform(z, x, y), TILE_SIZE, TILE_SIZE, tile_ground_pixel(z, y), year)
+    return encode_rgba(rgba, image_format)
+
+
+def warp_layers(layers: Sequence[str], lon1, lat1, lon2, lat2, year=0, dst_width=854, dst_height=480
+                ) -> Dict[str, Tuple[np.ndarray, Optional[float]]]:
+    """
+    Cut several layers out of the same area: the destination transform is computed once and
+    layers sharing a dtype, resampling and overview level are warped together as one multi-band warp.
+    Returns {layer: (cutout, vmax)} in the order given.
+    """
+    subset_transform = overlay_transform(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    sources = {}
+    for layer in dict.fromkeys(layers):
+        data, vmax = layer_source(layer, year)
+        sources[layer] = overview_source(layer, data, year, subset_transform), vmax
+
+    groups = {}
+    for layer, ((data, src_transform), _) in sources.items():
+        groups.setdefault((data.dtype, get_layer(layer).resampling, src_transform), []).append(layer)
+
+    cutouts = {}
+    for (_, resampling, src_transform), group in groups.items():
+        bands = np.stack([sources[layer][0][0] for layer in group])
+        warped = warp_overlay(bands, subset_transform, dst_width, dst_height, resampling, src_transform)
+        for layer, band in zip(group, warped):
+            cutouts[layer] = band
+    return {layer: (cutouts[layer], vmax) for layer, (_, vmax) in sources.items()}
+
+
+def render_composite(layers: Sequence[str], lon1, lat1, lon2, lat2, year=0, dst_width=854, dst_height=480,
+                     image_format='png'):
+    """
+    Render several layers into one image, alpha-composited in the order given (first at the bottom).
+    """
+    cutouts = warp_layers(layers, lon1, lat1, lon2, lat2, year, dst_width, dst_height)
+    rgba = composite_rgba(colorize(layer, array, vmax) for layer, (array, vmax) in cutouts.items())
+    return encode_rgba(rgba, image_format)
+
+
+def render_bundle(layers: Sequence[str], lon1, lat1, lon2, lat2, year=0, dst_width=854, dst_height=480,
+                  image_format='png') -> Dict[str, bytes]:
+    """
+    Render several layers of the same area as separate encoded images, {layer: image bytes}.
+    """
+    cutouts = warp_layers(layers, lon1, lat1, lon2, lat2, year, dst_width, dst_height)
+    return {layer: encode_rgba(colorize(layer, array, vmax), image_format).getvalue()
+            for layer, (array, vmax) in cutouts.items()}
+
+
+def cutout_values(layer, lon1, lat1, lon2, lat2, year=0, dst_width=None, dst_height=None):
+    """
+    Cut out the values (not colours) of one layer/year; the size defaults to the grid's own resolution,
+    and a missing width or height follows the aspect ratio of the area. Returns the cutout and its transform.
+    """
+    if dst_width is None or dst_height is None:
+        dst_width, dst_height = overlay_native_size(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    data, _ = layer_source(layer, year)
+    subset_transform = overlay_transform(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    return warp_overlay(data, subset_transform, dst_width, dst_height, get_layer(layer).resampling), subset_transform
+
+
+def cutout_cube(layer, lon1, lat1, lon2, lat2, years=slice(None), dst_width=854, dst_height=480, overviews=False):
+    """
+    Cut every year of a layer out of one area in a single warp, from the overview levels if
+    overviews is set. Returns the [year, dst_height, dst_width] cube, its transform and the per-year vmax.
+    """
+    render_layer = get_layer(layer)
+    stack, vmaxes = layer_stack(layer, years)
+    subset_transform = overlay_transform(lon1, lat1, lon2, lat2, dst_width, dst_height)
+    src_transform = None
+    if overviews:
+        stack, src_transform = overview_source(layer, stack, years, subset_transform)
+    cube = warp_overlay(stack, subset_transform, dst_width, dst_height, render_layer.resampling, src_transform)
+    return cube, subset_transform, vmaxes
+
+
+def render_animation(layer, lon1, lat1, lon2, lat2, years=slice(None), dst_width=854, dst_height=480,
+                     image_format='png', duration_ms=500):
+    """
+    Render a layer over a range of years as one animated image, one frame per year.
+    """
+    cube, _, vmaxes = cutout_cube(layer, lon1, lat1, lon2, lat2, years, dst_width, dst_height, overviews=True)
+    frames = [colorize(layer, frame, vmax) for frame, vmax in zip(cube, vmaxes)]
+    return encode_animation(frames, image_format, duration_ms)
 
 
 if __name__ == '__main__':
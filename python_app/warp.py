@@ -0,0 +1,254 @@
+"""
+Fast path for cutting the common grid into cutouts.
+
+Every cutout stays in the grid's own CRS, so the warp is only an axis-aligned crop and scale.
+Instead of running a full GDAL reproject for every layer, the source row/column of every
+destination row/column is computed once per (transform, size) and cached as a WarpPlan:
+integer index vectors for nearest, four-tap separable weights for cubic. Applying a plan is a
+pair of np.take calls for nearest, four per axis plus weighted sums for cubic.
+
+Results match GDAL: nearest is identical, cubic agrees to float32 rounding. GDAL widens the
+cubic kernel when downsampling, so cubic plans are only built for cutouts at least as fine
+as the grid; other cases return None and the caller falls back to rasterio.
+
+Destinations in another CRS (Web Mercator tiles) are not axis-aligned in the grid, so a
+PixelPlan maps every destination pixel centre through the projection to its own source
+row/column instead, with the same nearest and cubic taps.
+"""
+import os
+import threading
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import numpy as np
+from affine import Affine
+from pyproj import Transformer
+from rasterio.warp import Resampling
+
+WARP_PLAN_CACHE_SIZE = int(os.environ.get("WARP_PLAN_CACHE_SIZE", 1024))
+# Pixel plans hold per-pixel taps (about 1 MB for a nearest, 4 MB for a cubic 256x256 tile).
+PIXEL_PLAN_CACHE_SIZE = int(os.environ.get("PIXEL_PLAN_CACHE_SIZE", 64))
+# Same guard GDAL adds before flooring source coordinates for nearest neighbour.
+_NEAREST_EPSILON = 1e-10
+
+_transformers = threading.local()
+
+
+def crs_transformer(src_crs: str, crs) -> Transformer:
+    """
+    src_crs (an authority string) -> crs transformer, built once per thread (pyproj transformers
+    are not shared across threads).
+    """
+    # Keyed on the CRS object itself: formatting a rasterio CRS as WKT to build a key costs ~10 ms.
+    cache = _transformers.__dict__.setdefault("by_crs", {})
+    key = (src_crs, id(crs))
+    entry = cache.get(key)
+    if entry is None or entry[0] is not crs:
+        entry = cache[key] = (crs, Transformer.from_crs(src_crs, crs, always_xy=True))
+    return entry[1]
+
+
+def lonlat_transformer(crs) -> Transformer:
+    """
+    WGS84 -> crs transformer, built once per thread.
+    """
+    return crs_transformer("EPSG:4326", crs)
+
+
+def fill_value(dtype) -> float:
+    """
+    Value given to cutout pixels outside the grid: NaN for floats, the type's maximum
+    (255 is the land cover nodata class) for integers.
+    """
+    dtype = np.dtype(dtype)
+    return np.nan if dtype.kind == 'f' else np.iinfo(dtype).max
+
+
+class WarpPlan(NamedTuple):
+    """
+    Precomputed sampling of a grid window into a cutout.
+
+    - window: (row_start, row_stop, col_start, col_stop) of the source window the taps index into.
+    - rows / cols: (dst_height, taps) and (dst_width, taps) tap indices relative to the window.
+    - row_weights / col_weights: matching weights, or None for nearest (one tap, weight 1).
+    - valid_rows / valid_cols: destination rows/columns whose pixel centre lies on the grid.
+    """
+    window: tuple
+    rows: np.ndarray
+    cols: np.ndarray
+    row_weights: Optional[np.ndarray]
+    col_weights: Optional[np.ndarray]
+    valid_rows: np.ndarray
+    valid_cols: np.ndarray
+
+
+def _source_coordinates(origin, step, grid_origin, grid_step, size):
+    # Fractional source pixel coordinate of each destination pixel centre along one axis.
+    return (origin + (np.arange(size) + 0.5) * step - grid_origin) / grid_step
+
+
+def _cubic_weights(x):
+    # Keys cubic convolution kernel with a = -0.5, as used by GDAL.
+    x = np.abs(x)
+    return np.where(x <= 1, (1.5 * x - 2.5) * x * x + 1,
+                    np.where(x < 2, ((-0.5 * x + 2.5) * x - 4) * x + 2, 0.0))
+
+
+def _axis_taps(coords, length, resampling):
+    valid = (coords >= 0) & (coords < length)
+    if resampling == Resampling.nearest:
+        taps = np.floor(coords + _NEAREST_EPSILON).astype(np.intp)[:, None]
+        weights = None
+    else:
+        centred = coords - 0.5
+        taps = np.floor(centred).astype(np.intp)[:, None] + np.arange(-1, 3)
+        weights = _cubic_weights(centred[:, None] - taps)
+        # Taps falling off the grid are dropped and the remaining weights renormalised, like GDAL.
+        weights[(taps < 0) | (taps >= length)] = 0
+        total = weights.sum(axis=1, keepdims=True)
+        np.divide(weights, total, out=weights, where=total != 0)
+    taps = np.clip(taps, 0, length - 1)
+    return taps, weights, valid
+
+
+@lru_cache(maxsize=WARP_PLAN_CACHE_SIZE)
+def warp_plan(grid_transform: Affine, grid_height: int, grid_width: int, dst_transform: Affine,
+              dst_width: int, dst_height: int, resampling: Resampling) -> Optional[WarpPlan]:
+    """
+    Build (and cache) the plan sampling a grid into a cutout, or None if the fast path does not apply.
+    """
+    if resampling not in (Resampling.nearest, Resampling.cubic):
+        return None
+    if grid_transform.b or grid_transform.d or dst_transform.b or dst_transform.d:
+        return None
+    if resampling == Resampling.cubic and (abs(dst_transform.a) > abs(grid_transform.a)
+                                           or abs(dst_transform.e) > abs(grid_transform.e)):
+        return None
+
+    row_coords = _source_coordinates(dst_transform.f, dst_transform.e, grid_transform.f, grid_transform.e, dst_height)
+    col_coords = _source_coordinates(dst_transform.c, dst_transform.a, grid_transform.c, grid_transform.a, dst_width)
+    rows, row_weights, valid_rows = _axis_taps(row_coords, grid_height, resampling)
+    cols, col_weights, valid_cols = _axis_taps(col_coords, grid_width, resampling)
+
+    # Only the window actually sampled is read, which keeps small cutouts cheap.
+    row_start, row_stop = int(rows.min()), int(rows.max()) + 1
+    col_start, col_stop = int(cols.min()), int(cols.max()) + 1
+    plan = WarpPlan((row_start, row_stop, col_start, col_stop), rows - row_start, cols - col_start,
+                    row_weights, col_weights, valid_rows, valid_cols)
+    for array in plan[1:]:
+        if array is not None:
+            array.flags.writeable = False
+    return plan
+
+
+def apply_plan(plan: WarpPlan, src_array: np.ndarray) -> np.ndarray:
+    """
+    Sample a grid, or a [band, rows, columns] stack of grids, through a plan.
+    """
+    row_start, row_stop, col_start, col_stop = plan.window
+    window = src_array[..., row_start:row_stop, col_start:col_stop]
+
+    if plan.row_weights is None:
+        dst_array = window.take(plan.rows[:, 0], axis=-2).take(plan.cols[:, 0], axis=-1)
+    else:
+        # Rows first, then columns; each pass accumulates its four weighted taps.
+        row_weights = plan.row_weights.astype(src_array.dtype)[:, :, None]
+        work = window.take(plan.rows[:, 0], axis=-2) * row_weights[:, 0]
+        for tap in range(1, 4):
+            work += window.take(plan.rows[:, tap], axis=-2) * row_weights[:, tap]
+        col_weights = plan.col_weights.astype(src_array.dtype)
+        dst_array = work.take(plan.cols[:, 0], axis=-1) * col_weights[:, 0]
+        for tap in range(1, 4):
+            dst_array += work.take(plan.cols[:, tap], axis=-1) * col_weights[:, tap]
+
+    if not (plan.valid_rows.all() and plan.valid_cols.all()):
+        outside = ~(plan.valid_rows[:, None] & plan.valid_cols[None, :])
+        dst_array[..., outside] = fill_value(dst_array.dtype)
+    return dst_array
+
+
+class PixelPlan(NamedTuple):
+    """
+    Precomputed sampling of a grid into a destination raster in another CRS.
+
+    - window: (row_start, row_stop, col_start, col_stop) of the source window the taps index into.
+    - rows / cols: (pixels, taps) tap indices relative to the window, one row per destination pixel.
+    - row_weights / col_weights: matching weights, or None for nearest.
+    - valid: (dst_height, dst_width) destination pixels whose centre lies on the grid.
+    """
+    window: tuple
+    rows: np.ndarray
+    cols: np.ndarray
+    row_weights: Optional[np.ndarray]
+    col_weights: Optional[np.ndarray]
+    valid: np.ndarray
+
+
+@lru_cache(maxsize=PIXEL_PLAN_CACHE_SIZE)
+def pixel_plan(grid_transform: Affine, grid_height: int, grid_width: int, grid_crs, dst_crs: str,
+               dst_transform: Affine, dst_width: int, dst_height: int, resampling: Resampling) -> Optional[PixelPlan]:
+    """
+    Build (and cache) the plan sampling a grid into a raster in dst_crs, or None if the fast path does not apply.
+    """
+    if resampling not in (Resampling.nearest, Resampling.cubic):
+        return None
+    if grid_transform.b or grid_transform.d:
+        return None
+
+    cols, rows = np.meshgrid(np.arange(dst_width) + 0.5, np.arange(dst_height) + 0.5)
+    xs, ys = dst_transform * (cols.ravel(), rows.ravel())
+    xs, ys = crs_transformer(dst_crs, grid_crs).transform(xs, ys)
+    col_coords = (np.asarray(xs) - grid_transform.c) / grid_transform.a
+    row_coords = (np.asarray(ys) - grid_transform.f) / grid_transform.e
+    if resampling == Resampling.cubic:
+        # Like warp_plan: GDAL widens the cubic kernel when downsampling, which taps cannot reproduce.
+        steps = (np.abs(np.diff(col_coords.reshape(dst_height, dst_width), axis=1)),
+                 np.abs(np.diff(row_coords.reshape(dst_height, dst_width), axis=0)))
+        if any(step.size and np.nanmax(step) > 1 for step in steps):
+            return None
+    finite = np.isfinite(col_coords) & np.isfinite(row_coords)
+    col_coords[~finite] = -1
+    row_coords[~finite] = -1
+
+    rows, row_weights, valid_rows = _axis_taps(row_coords, grid_height, resampling)
+    cols, col_weights, valid_cols = _axis_taps(col_coords, grid_width, resampling)
+    valid = valid_rows & valid_cols
+    if valid.any():
+        row_start, row_stop = int(rows[valid].min()), int(rows[valid].max()) + 1
+        col_start, col_stop = int(cols[valid].min()), int(cols[valid].max()) + 1
+    else:
+        row_start, row_stop, col_start, col_stop = 0, 1, 0, 1
+    rows = np.clip(rows - row_start, 0, row_stop - row_start - 1).astype(np.int32)
+    cols = np.clip(cols - col_start, 0, col_stop - col_start - 1).astype(np.int32)
+    plan = PixelPlan((row_start, row_stop, col_start, col_stop), rows, cols,
+                     None if row_weights is None else row_weights.astype(np.float32),
+                     None if col_weights is None else col_weights.astype(np.float32),
+                     valid.reshape(dst_height, dst_width))
+    for array in plan[1:]:
+        if array is not None:
+            array.flags.writeable = False
+    return plan
+
+
+def apply_pixel_plan(plan: PixelPlan, src_array: np.ndarray) -> np.ndarray:
+    """
+    Sample a grid, or a [band, rows, columns] stack of grids, through a pixel plan.
+    """
+    row_start, row_stop, col_start, col_stop = plan.window
+    window = np.asarray(src_array[..., row_start:row_stop, col_start:col_stop])
+    dst_height, dst_width = plan.valid.shape
+
+    if plan.row_weights is None:
+        dst_array = window[..., plan.rows[:, 0], plan.cols[:, 0]]
+    else:
+        dst_array = np.zeros(window.shape[:-2] + (len(plan.rows),), dtype=src_array.dtype)
+        for row_tap in range(4):
+            row_weight = plan.row_weights[:, row_tap].astype(src_array.dtype)
+            for col_tap in range(4):
+                weight = row_weight * plan.col_weights[:, col_tap].astype(src_array.dtype)
+                dst_array += window[..., plan.rows[:, row_tap], plan.cols[:, col_tap]] * weight
+
+    dst_array = dst_array.reshape(window.shape[:-2] + (dst_height, dst_width))
+    if not plan.valid.all():
+        dst_array[..., ~plan.valid] = fill_value(dst_array.dtype)
+    return dst_array
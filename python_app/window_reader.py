@@ -0,0 +1,237 @@
+"""
+Windowed access to per-year GeoTIFFs that are already on the common grid.
+
+Instead of reading every file in full, a WindowedStack keeps the files open through a bounded
+HandlePool and reads only the internal blocks (tiles or strips) that overlap a requested window,
+through a byte-bounded LRU BlockCache shared by all files. It is a LazyStack, so it slices like the
+masked [year, rows, columns] stack it stands in for.
+
+Files stored as strips read best after write_tiled_copy() has converted them to tiled GeoTIFFs.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from python_app.lazy_stack import LazyStack
+
+BLOCK_CACHE_BYTES = int(os.environ.get("BLOCK_CACHE_BYTES", 128 * 1024 * 1024))
+HANDLES_PER_FILE = int(os.environ.get("HANDLES_PER_FILE", 4))
+
+
+class HandlePool:
+    """
+    Open rasterio datasets, at most max_per_path per file; each handle is used by one thread at a time.
+
+    Handles are pooled per (path, version): once a file has been replaced on disk, opening its new
+    version closes the idle handles of the old one, which may still point at the replaced file.
+    """
+
+    def __init__(self, max_per_path: int = HANDLES_PER_FILE):
+        self.max_per_path = max_per_path
+        self._idle = {}
+        self._open = {}
+        self._condition = threading.Condition()
+
+    def _discard_other_versions(self, source):
+        for other in [other for other in self._idle if other[0] == source[0] and other != source]:
+            for handle in self._idle.pop(other):
+                handle.close()
+                self._open[other] -= 1
+
+    @contextmanager
+    def open(self, path: str, version: Hashable = None):
+        source = (path, version)
+        with self._condition:
+            while True:
+                if source not in self._idle:
+                    self._discard_other_versions(source)
+                idle = self._idle.setdefault(source, [])
+                if idle:
+                    handle = idle.pop()
+                    break
+                if self._open.get(source, 0) < self.max_per_path:
+                    self._open[source] = self._open.get(source, 0) + 1
+                    handle = None
+                    break
+                self._condition.wait()
+        if handle is None:
+            try:
+                handle = rasterio.open(path)
+            except Exception:
+                with self._condition:
+                    self._open[source] -= 1
+                    self._condition.notify()
+                raise
+        try:
+            yield handle
+        finally:
+            with self._condition:
+                self._idle.setdefault(source, []).append(handle)
+                self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            for source, handles in self._idle.items():
+                for handle in handles:
+                    handle.close()
+                    self._open[source] = self._open.get(source, 1) - 1
+            self._idle.clear()
+
+
+class BlockCache:
+    """
+    Thread-safe LRU cache of decoded raster blocks bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes: int = BLOCK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return block
+
+    def put(self, key: Hashable, block: np.ndarray):
+        block.flags.writeable = False
+        if block.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._blocks[key] = block
+            self.current_bytes += block.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"blocks": len(self._blocks), "bytes": self.current_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+handle_pool = HandlePool()
+block_cache = BlockCache()
+
+
+class WindowedRaster:
+    """
+    One band of a GeoTIFF, read block by block through the shared pool and cache.
+    Its handles and cached blocks belong to the version (size, mtime) of the file it was opened on.
+    """
+
+    def __init__(self, path: str, band: int = 1, pool: HandlePool = handle_pool, cache: BlockCache = block_cache):
+        self.path = path
+        self.band = band
+        self.pool = pool
+        self.cache = cache
+        stat = os.stat(path)
+        self.version = (stat.st_size, stat.st_mtime_ns)
+        with pool.open(path, self.version) as src:
+            self.height, self.width = src.height, src.width
+            self.block_height, self.block_width = src.block_shapes[band - 1]
+            self.dtype = np.dtype(src.dtypes[band - 1])
+            self.nodata = src.nodata
+            self.transform = src.transform
+            self.crs = src.crs
+
+    def _block(self, block_row: int, block_col: int) -> np.ndarray:
+        key = (self.path, self.version, self.band, block_row, block_col)
+        block = self.cache.get(key)
+        if block is None:
+            window = Window(block_col * self.block_width, block_row * self.block_height,
+                            min(self.block_width, self.width - block_col * self.block_width),
+                            min(self.block_height, self.height - block_row * self.block_height))
+            with self.pool.open(self.path, self.version) as src:
+                block = src.read(self.band, window=window)
+            self.cache.put(key, block)
+        return block
+
+    def read(self, row_start: int, row_stop: int, col_start: int, col_stop: int) -> np.ndarray:
+        """
+        Read rows [row_start, row_stop) x columns [col_start, col_stop), clipped to the raster.
+        """
+        row_start, row_stop = max(row_start, 0), min(row_stop, self.height)
+        col_start, col_stop = max(col_start, 0), min(col_stop, self.width)
+        out = np.empty((max(row_stop - row_start, 0), max(col_stop - col_start, 0)), dtype=self.dtype)
+        if out.size == 0:
+            return out
+        for block_row in range(row_start // self.block_height, (row_stop - 1) // self.block_height + 1):
+            top = block_row * self.block_height
+            for block_col in range(col_start // self.block_width, (col_stop - 1) // self.block_width + 1):
+                left = block_col * self.block_width
+                block = self._block(block_row, block_col)
+                r0, r1 = max(row_start, top), min(row_stop, top + block.shape[0])
+                c0, c1 = max(col_start, left), min(col_stop, left + block.shape[1])
+                out[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+                    block[r0 - top:r1 - top, c0 - left:c1 - left]
+        return out
+
+
+class WindowedStack(LazyStack):
+    """
+    Lazy, read-only [year, rows, columns] float32 stack over one WindowedRaster per year, with the
+    pixels selected by nodata_rule set to NaN. Indexing one year (or a slice of years) returns
+    another lazy stack; selecting rows/columns reads just the blocks involved.
+    """
+
+    def __init__(self, rasters: Sequence[WindowedRaster], nodata_rule: Callable, nodata, squeeze: bool = False):
+        first = rasters[0]
+        super().__init__(rasters, (first.height, first.width), np.float32, squeeze)
+        self.rasters = self.years
+        self.nodata_rule = nodata_rule
+        self.nodata = nodata
+
+    def _read(self, rasters: List[WindowedRaster], row_start, row_stop, col_start, col_stop) -> np.ndarray:
+        raw = np.stack([raster.read(row_start, row_stop, col_start, col_stop) for raster in rasters])
+        values = raw.astype(np.float32)
+        values[self.nodata_rule(raw, self.nodata)] = np.nan
+        return values
+
+    def _subset(self, rasters: List[WindowedRaster], squeeze: bool) -> "WindowedStack":
+        return WindowedStack(rasters, self.nodata_rule, self.nodata, squeeze)
+
+    def year_extrema(self) -> Tuple[List[float], List[float]]:
+        """
+        Per-year minimum and maximum of the valid pixels, streamed block by block.
+        """
+        minima, maxima = [], []
+        for raster in self.rasters:
+            low = high = np.nan
+            for row in range(0, raster.height, raster.block_height):
+                values = self._read([raster], row, row + raster.block_height, 0, raster.width)
+                if np.isfinite(values).any():
+                    low = np.nanmin([low, np.nanmin(values)])
+                    high = np.nanmax([high, np.nanmax(values)])
+            minima.append(float(low))
+            maxima.append(float(high))
+        return minima, maxima
+
+
+def write_tiled_copy(src_path: str, dst_path: str, block_size: int = 256):
+    """
+    Copy a GeoTIFF as a DEFLATE-compressed tiled GeoTIFF, so windowed reads touch few small blocks.
+    """
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        profile.update(tiled=True, blockxsize=block_size, blockysize=block_size, compress="deflate")
+        with rasterio.open(dst_path, "w", **profile) as dst:
+            for _, window in src.block_windows(1):
+                dst.write(src.read(window=window), window=window)
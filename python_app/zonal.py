@@ -0,0 +1,179 @@
+"""
+Zonal statistics of the layers over the Admin_layers polygons.
+
+Each zone layer is rasterised once onto common_grid into a label array (0 = outside every
+zone). The labelled pixels are kept in label order, so for any [year, rows, columns] stack one
+gather yields a [year, pixel] matrix whose zones are contiguous runs: sums and counts come from
+a single np.bincount over (year, label), and min/max/percentiles from one sort per year.
+Tables are memoised per (zones, layer, data version); every statistic of a layer comes from the same table.
+"""
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from python_app.analytics import derived_grid
+from python_app.data_loader import (DATASET_ROOT, STAT_PERCENTILES, OnceCache, common_grid, layer_registry,
+                                    load_vector_dataset)
+from python_app.visualizer import get_layer, layer_stack
+
+ADMIN_ROOT = os.path.join(DATASET_ROOT, "Admin_layers")
+
+
+class ZoneLayer(NamedTuple):
+    path: str
+    name_field: str
+    code_field: str
+
+
+ZONE_LAYERS = {
+    "districts": ZoneLayer(os.path.join(ADMIN_ROOT, "Assaba_Districts_layer.shp"), "ADM3_EN", "ADM3_PCODE"),
+    "regions": ZoneLayer(os.path.join(ADMIN_ROOT, "Assaba_Region_layer.shp"), "ADM2_EN", "ADM2_PCODE"),
+}
+ZONAL_STATS = ("count", "sum", "mean", "min", "max") + tuple(f"p{p}" for p in STAT_PERCENTILES)
+
+
+class ZoneLabels(NamedTuple):
+    """
+    - names / codes: zone i (0-based) is label i + 1.
+    - pixels: flat grid indices of all labelled pixels, ordered by label.
+    - starts / sizes: where each zone's run begins in pixels and how many pixels it has.
+    """
+    names: List[str]
+    codes: List[str]
+    pixels: np.ndarray
+    starts: np.ndarray
+    sizes: np.ndarray
+
+
+_labels = OnceCache()
+_tables = OnceCache()
+
+
+def _rasterise(zones: str) -> ZoneLabels:
+    from rasterio import features
+
+    zone_layer = ZONE_LAYERS[zones]
+    gdf = load_vector_dataset(zone_layer.path).to_crs(common_grid["crs"].to_wkt())
+    labels = features.rasterize(
+        ((geometry, i + 1) for i, geometry in enumerate(gdf.geometry)),
+        out_shape=(common_grid["height"], common_grid["width"]),
+        transform=common_grid["transform"],
+        fill=0,
+        dtype=np.int32,
+    ).ravel()
+
+    pixels = np.flatnonzero(labels)
+    pixels = pixels[np.argsort(labels[pixels], kind="stable")]
+    sizes = np.bincount(labels[pixels] - 1, minlength=len(gdf))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    for array in (pixels, starts, sizes):
+        array.flags.writeable = False
+    return ZoneLabels(gdf[zone_layer.name_field].tolist(), gdf[zone_layer.code_field].tolist(),
+                      pixels, starts, sizes)
+
+
+def zone_labels(zones: str) -> ZoneLabels:
+    if zones not in ZONE_LAYERS:
+        raise ValueError(f"Unknown zones: {zones}")
+    return _labels.get(zones, lambda: _rasterise(zones))
+
+
+def _zone_table(stack: np.ndarray, labels: ZoneLabels) -> Dict[str, np.ndarray]:
+    """
+    All ZONAL_STATS of a [year, rows, columns] stack as {stat: [year, zone] array}.
+    The stack is read one year at a time, so a lazy (windowed) stack is never loaded in full.
+    """
+    years = [_zone_stats(np.asarray(stack[year]).reshape(1, -1)[:, labels.pixels].astype(np.float64), labels)
+             for year in range(len(stack))]
+    table = {stat: np.concatenate([year[stat] for year in years]) for stat in years[0]}
+    for array in table.values():
+        array.flags.writeable = False
+    return table
+
+
+def _zone_stats(values: np.ndarray, labels: ZoneLabels) -> Dict[str, np.ndarray]:
+    """
+    All ZONAL_STATS of a [year, labelled pixel] matrix (labels.pixels order) as {stat: [year, zone] array}.
+    """
+    n_years, n_zones = len(values), len(labels.names)
+    zone_of_pixel = np.repeat(np.arange(n_zones), labels.sizes)
+    valid = np.isfinite(values)
+
+    # Sums and counts for every (year, zone) pair in one bincount.
+    bins = (np.arange(n_years)[:, None] * n_zones + zone_of_pixel).ravel()
+    count = np.bincount(bins, weights=valid.ravel(), minlength=n_years * n_zones).reshape(n_years, n_zones)
+    total = np.bincount(bins, weights=np.where(valid, values, 0).ravel(),
+                        minlength=n_years * n_zones).reshape(n_years, n_zones)
+
+    # Sorting each year by (zone, value) puts every zone's valid values first in its run, ascending.
+    order = np.lexsort((values, np.broadcast_to(zone_of_pixel, values.shape)), axis=-1)
+    ordered = np.take_along_axis(values, order, axis=-1)
+    has_values = count > 0
+    last = np.maximum(count - 1, 0)
+
+    def ranked(rank):
+        # Linearly interpolated value at a fractional rank inside each zone, like np.percentile.
+        low = np.floor(rank).astype(np.intp)
+        high = np.minimum(low + 1, last.astype(np.intp))
+        frac = rank - low
+        at = labels.starts[None, :]
+        low_values = np.take_along_axis(ordered, np.minimum(at + low, ordered.shape[1] - 1), axis=-1)
+        high_values = np.take_along_axis(ordered, np.minimum(at + high, ordered.shape[1] - 1), axis=-1)
+        return np.where(has_values, low_values + (high_values - low_values) * frac, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table = {
+            "count": count,
+            "sum": np.where(has_values, total, np.nan),
+            "mean": total / count,
+            "min": ranked(np.zeros_like(last)),
+            "max": ranked(last),
+        }
+    for p in STAT_PERCENTILES:
+        table[f"p{p}"] = ranked(last * (p / 100))
+    return table
+
+
+def zonal_table(layer: str, zones: str = "districts") -> Dict[str, np.ndarray]:
+    """
+    Memoised {stat: [year, zone] array} of a layer; derived layers have a single "year".
+    """
+    labels = zone_labels(zones)
+
+    render_layer = get_layer(layer)
+    if render_layer.derived:
+        # Keyed by the grid's key, so a refreshed analytics grid gets its own table.
+        grid = derived_grid(render_layer.source)
+        return _tables.get((zones, layer, grid.key), lambda: _zone_table(grid.array[None], labels))
+
+    def build():
+        stack, _ = layer_stack(layer, slice(None))
+        if stack.dtype.kind != 'f':
+            raise ValueError(f"Layer {layer} is categorical; zonal statistics need a continuous layer")
+        return _zone_table(stack, labels)
+
+    # Keyed by the dataset's cache key, so a reloaded dataset gets its own table.
+    return _tables.get((zones, layer, layer_registry.key(render_layer.source)), build)
+
+
+def zonal_statistics(layer: str, zones: str = "districts", stats=ZONAL_STATS) -> dict:
+    """
+    JSON-ready per-zone statistics, one value per year (null where a zone has no valid pixels).
+    """
+    unknown = set(stats) - set(ZONAL_STATS)
+    if unknown:
+        raise ValueError(f"Unknown statistics: {', '.join(sorted(unknown))}")
+    table = zonal_table(layer, zones)
+    labels = zone_labels(zones)
+    n_years = len(table["count"])
+    years: Optional[List[int]] = None if get_layer(layer).derived else list(range(2010, 2010 + n_years))
+
+    results = []
+    for zone, (name, code) in enumerate(zip(labels.names, labels.codes)):
+        entry = {"name": name, "code": code, "pixels": int(labels.sizes[zone])}
+        for stat in stats:
+            column = table[stat][:, zone]
+            entry[stat] = [None if np.isnan(v) else v for v in column.tolist()]
+        results.append(entry)
+    return {"layer": layer, "zones": zones, "years": years, "stats": list(stats), "results": results}